@@ -1,6 +1,15 @@
-from flask import Flask, jsonify, request, send_from_directory
-from product_manager import ProductManager
-from order_manager import OrderManager
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, send_file, send_from_directory
+from database import Database, DEFAULT_POOL_SIZE, DEFAULT_MAX_OVERFLOW, DEFAULT_POOL_TIMEOUT
+from query_stats import SLOW_QUERY_MS, QUERY_DEBUG, N_PLUS_ONE_THRESHOLD
+from product_manager import ProductManager, PRODUCT_CATEGORIES
+from order_manager import OrderManager, ORDER_COLUMNS, MAX_ORDERS_PAGE_SIZE
+from order_events import OrderChangeFeed, OrderEventBus, format_sse
+from facet_index import MATCH_ALL, MATCH_ANY
+from flask.json.provider import DefaultJSONProvider
+from qr_service import QR_FORMATS
+import metrics
+import request_context
+import image_variants
 from flask_cors import CORS
 import mysql.connector
 import hashlib
@@ -8,26 +17,237 @@ import json
 from decimal import Decimal
 from datetime import datetime
 import os
+import gzip
+import threading
+import time
 from werkzeug.exceptions import NotFound
+from werkzeug.local import LocalProxy
+from werkzeug.utils import safe_join
 
-app = Flask(__name__)
-CORS(app)
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
 
-product_manager = ProductManager()
-order_manager = OrderManager()
+bp = Blueprint('api', __name__)
+
+
+class AppServices:
+    """Database, managers, event bus and order change feed of one app in one process.
+
+    One pooled Database is shared by both managers; each request thread
+    borrows its own connection and hands it back in release_db_connection().
+    """
+
+    def __init__(self, config):
+        self.pid = os.getpid()
+        self.db = Database(
+            pool_size=config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+            max_overflow=config.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+            slow_query_ms=config.get('SLOW_QUERY_MS', SLOW_QUERY_MS),
+            query_debug=config.get('QUERY_DEBUG', QUERY_DEBUG),
+            n_plus_one_threshold=config.get('N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD)
+        )
+        self.product_manager = ProductManager(db=self.db)
+        self.order_manager = OrderManager(db=self.db)
+        self.order_events = OrderEventBus()
+        self.order_feed = OrderChangeFeed(self.order_events, self.order_manager)
+        self.db.add_query_observer(metrics.observe_query)
+        metrics.register_service_collectors(
+            self.db, self.product_manager.catalog_cache, self.order_manager.qr_service
+        )
+
+    def ensure_process(self):
+        if self.pid != os.getpid():
+            # Forked child: keep the warmed catalog cache, but never share
+            # MySQL sockets or event-bus waiters with the parent process
+            self.db.reset_after_fork()
+            self.order_events = OrderEventBus()
+            self.order_feed = OrderChangeFeed(self.order_events, self.order_manager)
+            # Counters recorded by the master (e.g. cache warm-up) are not this worker's
+            metrics.REGISTRY.reset()
+            self.pid = os.getpid()
+
+
+_services_lock = threading.Lock()
+
+
+def get_services(app=None):
+    """Return the app's AppServices, creating them on first use in this process."""
+    app = app or current_app._get_current_object()
+    services = app.extensions.get('web_store')
+    if services is None:
+        with _services_lock:
+            services = app.extensions.get('web_store')
+            if services is None:
+                factory = app.config.get('SERVICES_FACTORY') or AppServices
+                services = factory(app.config)
+                app.extensions['web_store'] = services
+    if services.pid != os.getpid():
+        with _services_lock:
+            services.ensure_process()
+    return services
+
+
+# Resolved against the current app on each use, so importing this module
+# never touches the database
+db = LocalProxy(lambda: get_services().db)
+product_manager = LocalProxy(lambda: get_services().product_manager)
+order_manager = LocalProxy(lambda: get_services().order_manager)
+order_events = LocalProxy(lambda: get_services().order_events)
+
+SSE_HEARTBEAT_SECONDS = 15
+# Clients may keep the catalog but must revalidate it (cheap 304) on every use
+PRODUCTS_CACHE_CONTROL = 'public, no-cache'
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGES_DIR = os.path.abspath(os.path.join(BASE_DIR, '..', 'images'))
+# Variant URLs change whenever the source changes name, and the ETag tracks its content
+IMAGE_VARIANT_MAX_AGE = 7 * 24 * 3600
+# The QR of an order changes if its payload is reset, so clients revalidate via ETag
+QR_CACHE_CONTROL = 'private, no-cache'
+
+
+def _query_arg(name, parser):
+    raw = request.args.get(name)
+    if raw is None or not raw.strip():
+        return None
+    try:
+        return parser(raw.strip())
+    except ValueError:
+        raise ValueError(f"{name}={raw}")
+
+
+def _parse_positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise ValueError(f"{value} must be a positive integer")
+    return number
+
+
+def _wake_order_feed():
+    """Let this process's SSE subscribers see an order change without waiting for the next poll."""
+    get_services().order_feed.wake()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that adds jsonify() time to the request's serialization phase."""
+
+    def dumps(self, obj, **kwargs):
+        with request_context.timed('serialization'):
+            return super().dumps(obj, **kwargs)
+
 
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.request_id = request_context.new_request_id(request.headers.get(request_context.REQUEST_ID_HEADER))
+    request_context.bind(g.request_id)
+    g.query_scope = get_services().db.begin_query_scope(f"{request.method} {request.path}")
 
-@app.route('/images/<path:filename>')
+
+@bp.after_app_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_LATENCY.observe(elapsed, route, request.method)
+        metrics.HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+        scope = g.get('query_scope')
+        if scope is not None:
+            metrics.DB_QUERIES_PER_REQUEST.observe(scope.count, route)
+        response.headers['Server-Timing'] = _server_timing(scope, elapsed)
+    if g.get('request_id'):
+        response.headers[request_context.REQUEST_ID_HEADER] = g.request_id
+    return response
+
+
+def _server_timing(scope, total_seconds):
+    phases = []
+    if scope is not None:
+        phases.append(('db', scope.seconds, f"{scope.count} queries"))
+    serialization = request_context.timings().get('serialization')
+    if serialization:
+        phases.append(('serialization', serialization, None))
+    phases.append(('total', total_seconds, None))
+    return request_context.format_server_timing(phases)
+
+
+@bp.teardown_app_request
+def release_db_connection(_exc=None):
+    services = current_app.extensions.get('web_store')
+    if services is not None:
+        scope = g.pop('query_scope', None)
+        if scope is not None and services.db.current_query_scope() is scope:
+            services.db.end_query_scope()
+            if services.db.query_debug and scope.count:
+                print(f"{scope.label}: {scope.count} queries in {scope.seconds * 1000:.1f} ms")
+        services.db.release()
+    request_context.clear()
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Make sure pool/cache collectors exist even before the first DB request
+    get_services()
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@bp.route('/db/pool', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify(db.pool_stats())
+
+
+@bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'catalog': product_manager.catalog_cache.stats(),
+        'qr': order_manager.qr_service.stats()
+    })
+
+
+@bp.route('/images/<path:filename>')
 def serve_image(filename):
     sanitized = filename.replace('\\', '/')
+    try:
+        width = _query_arg('w', _parse_positive_int)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    fmt = (request.args.get('fmt') or '').strip().lower()
+    if (width or fmt) and image_variants.available():
+        return _serve_image_variant(sanitized, width, fmt)
     try:
         return send_from_directory(IMAGES_DIR, sanitized)
     except NotFound:
         return jsonify({'error': 'Image not found'}), 404
 
-@app.route('/register', methods=['POST'])
+
+def _serve_image_variant(filename, width, fmt):
+    source = safe_join(IMAGES_DIR, filename)
+    if source is None or not os.path.isfile(source):
+        return jsonify({'error': 'Image not found'}), 404
+    vary_accept = fmt == 'auto'
+    if vary_accept:
+        fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') and image_variants.webp_supported() else 'jpeg'
+    try:
+        fmt = image_variants.normalize_format(fmt or 'jpeg')
+        width = image_variants.snap_width(width or image_variants.VARIANT_WIDTHS[-1])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        path, etag, mimetype = image_variants.variant_path(source, width, fmt)
+    except Exception as e:
+        print(f"Could not build image variant for {filename}: {e}")
+        return send_from_directory(IMAGES_DIR, filename)
+    response = send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=IMAGE_VARIANT_MAX_AGE)
+    if vary_accept:
+        response.vary.add('Accept')
+    return response
+
+@bp.route('/register', methods=['POST'])
 def register():
     data = request.json
     name = data.get('name')
@@ -58,7 +278,7 @@ def register():
         return jsonify({'error': str(e)}), 500
 
 # --- User Login Endpoint ---
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     data = request.json
     email = data.get('email')
@@ -77,45 +297,193 @@ def login():
     except mysql.connector.Error as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/products', methods=['GET'])
+def _normalize_product_for_client(p):
+    """Reshape a ProductManager product dict into the JSON the frontends expect."""
+    # Convert Decimal and datetime to JSON-serializable types
+    for key, val in list(p.items()):
+        if isinstance(val, Decimal):
+            p[key] = float(val)
+        elif isinstance(val, datetime):
+            p[key] = val.isoformat()
+
+    # If backend provides structured filters, expose as attributes array for FE
+    if 'filters' in p and isinstance(p['filters'], dict):
+        attrs = []
+        for k, vals in p['filters'].items():
+            if isinstance(vals, list):
+                for v in vals:
+                    attrs.append({'type': k, 'value': v})
+            elif vals is not None:
+                attrs.append({'type': k, 'value': vals})
+        p['attributes'] = attrs
+    elif 'attributes' in p and isinstance(p['attributes'], dict):
+        # Legacy path: convert dict to array of {type, value}
+        p['attributes'] = [{'type': k, 'value': v} for k, vals in p['attributes'].items() for v in vals]
+
+    # Optionally, decode ai_keys JSON to array for convenience
+    if 'ai_keys' in p and isinstance(p['ai_keys'], str):
+        try:
+            parsed = json.loads(p['ai_keys'])
+            if isinstance(parsed, list):
+                p['ai_keys'] = parsed
+        except Exception:
+            pass
+    return p
+
+
+def _build_products_payload(products):
+    """Serialize a product list once, with compressed variants and one strong ETag per encoding."""
+    with request_context.timed('serialization'):
+        body = json.dumps(
+            [_normalize_product_for_client(p) for p in products],
+            ensure_ascii=False,
+            separators=(',', ':'),
+            default=str
+        ).encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()
+        payload = {
+            'identity': body,
+            'gzip': gzip.compress(body, compresslevel=6)
+        }
+        if brotli is not None:
+            payload['br'] = brotli.compress(body)
+        # Different bytes need different strong validators: "<sha1>", "<sha1>-gzip", "<sha1>-br"
+        payload['etags'] = {
+            encoding: f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+            for encoding in ('identity', 'gzip', 'br') if encoding in payload
+        }
+    return payload
+
+
+def _etag_matches(if_none_match, *etags):
+    """True if If-None-Match names any of ``etags`` (quoted), weakly or strongly."""
+    if not if_none_match:
+        return False
+    candidates = [item.strip() for item in if_none_match.split(',')]
+    if '*' in candidates:
+        return True
+    return any(etag in candidates or f'W/{etag}' in candidates for etag in etags)
+
+
+def _send_catalog_payload(payload):
+    accepted = request.headers.get('Accept-Encoding', '').lower()
+    encoding = 'identity'
+    if 'br' in payload and 'br' in accepted:
+        encoding = 'br'
+    elif 'gzip' in accepted:
+        encoding = 'gzip'
+    headers = {
+        'ETag': payload['etags'][encoding],
+        'Cache-Control': PRODUCTS_CACHE_CONTROL,
+        'Vary': 'Accept-Encoding'
+    }
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    # Any encoding's tag means the client holds this catalog version
+    if _etag_matches(request.headers.get('If-None-Match'), *payload['etags'].values()):
+        headers.pop('Content-Encoding', None)
+        return Response(status=304, headers=headers)
+    return Response(payload[encoding], status=200, headers=headers, mimetype='application/json')
+
+
+def _ai_keys_arg():
+    raw = request.args.get('ai_keys') or ''
+    return [item.strip() for item in raw.split(',') if item.strip()]
+
+
+def _category_arg():
+    """Optional ?category=, restricted to the products.category values."""
+    category = (request.args.get('category') or '').strip() or None
+    if category is not None and category not in PRODUCT_CATEGORIES:
+        raise ValueError(f"category={category} (expected one of {', '.join(PRODUCT_CATEGORIES)})")
+    return category
+
+
+def _match_arg():
+    match = (request.args.get('match') or MATCH_ALL).strip().lower()
+    if match not in (MATCH_ALL, MATCH_ANY):
+        raise ValueError(f"match={match}")
+    return match
+
+
+@bp.route('/products', methods=['GET'])
 def get_products():
-    products = product_manager.get_all_products()
-
-    # Normalize filters/attributes for frontend consumption and ensure JSON-safe types
-    for p in products:
-        # Convert Decimal and datetime to JSON-serializable types
-        for key, val in list(p.items()):
-            if isinstance(val, Decimal):
-                p[key] = float(val)
-            elif isinstance(val, datetime):
-                p[key] = val.isoformat()
-
-        # If backend provides structured filters, expose as attributes array for FE
-        if 'filters' in p and isinstance(p['filters'], dict):
-            attrs = []
-            for k, vals in p['filters'].items():
-                if isinstance(vals, list):
-                    for v in vals:
-                        attrs.append({'type': k, 'value': v})
-                elif vals is not None:
-                    attrs.append({'type': k, 'value': vals})
-            p['attributes'] = attrs
-        elif 'attributes' in p and isinstance(p['attributes'], dict):
-            # Legacy path: convert dict to array of {type, value}
-            p['attributes'] = [{'type': k, 'value': v} for k, vals in p['attributes'].items() for v in vals]
-
-        # Optionally, decode ai_keys JSON to array for convenience
-        if 'ai_keys' in p and isinstance(p['ai_keys'], str):
-            try:
-                parsed = json.loads(p['ai_keys'])
-                if isinstance(parsed, list):
-                    p['ai_keys'] = parsed
-            except Exception:
-                pass
+    try:
+        category = _category_arg()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    ai_keys = _ai_keys_arg()
+    if ai_keys:
+        try:
+            match = _match_arg()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+        products, _ = product_manager.filter_by_ai_keys(ai_keys, match=match, category=category)
+        return jsonify([_normalize_product_for_client(p) for p in products])
+
+    return _send_catalog_payload(_catalog_payload(category))
+
+
+def _catalog_payload(category):
+    cache = product_manager.catalog_cache
+    payload = cache.get_derived(category, 'json_payload')
+    if payload is None:
+        version = cache.version
+        products = product_manager.get_all_products(category)
+        payload = _build_products_payload(products)
+        cache.put_derived(category, version, 'json_payload', payload)
+    return payload
+
+
+def warm_caches(flask_app):
+    """Load ``flask_app``'s catalog, indexes and serialized payloads before serving traffic."""
+    started = time.perf_counter()
+    categories = []
+    with flask_app.app_context():
+        try:
+            categories = product_manager.warm_cache()
+            for category in [None] + categories:
+                _catalog_payload(category)
+        finally:
+            db.release()
+    print(f"Catalog cache warmed ({len(categories)} categories) in {(time.perf_counter() - started) * 1000:.1f} ms")
 
-    return jsonify(products)
 
-@app.route('/orders', methods=['GET'])
+@bp.route('/products/facets', methods=['GET'])
+def get_product_facets():
+    ai_keys = _ai_keys_arg()
+    try:
+        category = _category_arg()
+        match = _match_arg()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    products, counts = product_manager.filter_by_ai_keys(ai_keys, match=match, category=category)
+    return jsonify({
+        'selected': ai_keys,
+        'match': match,
+        'total': len(products),
+        'counts': counts
+    })
+
+
+@bp.route('/products/search', methods=['GET'])
+def search_products():
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Missing q parameter'}), 400
+    try:
+        limit = _query_arg('limit', _parse_positive_int) or DEFAULT_SEARCH_LIMIT
+        category = _category_arg()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    results = product_manager.search_catalog(
+        query,
+        category=category,
+        limit=min(limit, MAX_SEARCH_LIMIT)
+    )
+    return jsonify([_normalize_product_for_client(p) for p in results])
+
+@bp.route('/orders', methods=['GET'])
 def get_orders():
     status_param = request.args.get('status')
     status_filter = None
@@ -124,10 +492,51 @@ def get_orders():
             status_filter = [item.strip() for item in status_param.split(',') if item.strip()]
         else:
             status_filter = status_param.strip()
-    orders = order_manager.get_all_orders(status_filter)
-    return jsonify(orders)
 
-@app.route('/orders/<int:order_id>', methods=['GET'])
+    try:
+        after_id = _query_arg('after_id', _parse_positive_int)
+        limit = _query_arg('limit', _parse_positive_int)
+        created_from = _query_arg('created_from', datetime.fromisoformat)
+        created_to = _query_arg('created_to', datetime.fromisoformat)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    fields_param = request.args.get('fields')
+    fields = None
+    if fields_param:
+        fields = [item.strip() for item in fields_param.split(',') if item.strip()]
+        unknown = [name for name in fields if name not in ORDER_COLUMNS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    orders = order_manager.get_all_orders(
+        status_filter,
+        after_id=after_id,
+        limit=limit,
+        fields=fields,
+        created_from=created_from,
+        created_to=created_to
+    )
+    response = jsonify(orders)
+    if limit is not None and orders and len(orders) >= min(limit, MAX_ORDERS_PAGE_SIZE):
+        response.headers['X-Next-After-Id'] = str(orders[-1]['id'])
+    return response
+
+@bp.route('/orders/changes', methods=['GET'])
+def get_order_changes():
+    since = request.args.get('since')
+    status_param = request.args.get('status')
+    statuses = None
+    if status_param:
+        statuses = [item.strip() for item in status_param.split(',') if item.strip()]
+    try:
+        changes = order_manager.get_orders_changed_since(since or None, statuses)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if changes is None:
+        return jsonify({'error': 'Could not load order changes'}), 500
+    return jsonify(changes)
+
+@bp.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
     order = order_manager.get_order(order_id)
     if order:
@@ -135,8 +544,18 @@ def get_order(order_id):
     else:
         return jsonify({'error': 'Order not found'}), 404
 
-@app.route('/orders', methods=['POST'])
+@bp.route('/orders', methods=['POST'])
 def create_order():
+    response = current_app.make_response(_create_order())
+    outcome = g.pop('order_outcome', None)
+    if outcome is None:
+        # Rejected before reaching OrderManager, or failed unexpectedly
+        outcome = 'validation' if response.status_code == 400 else 'error'
+    metrics.ORDER_CREATE.inc(outcome)
+    return response
+
+
+def _create_order():
     try:
         data = request.json
         
@@ -224,11 +643,13 @@ def create_order():
             email_receipt,
             payment_status
         )
+        g.order_outcome = 'ok' if order_id else (order_manager.last_error_code or 'unknown')
         if order_id:
             payload = {'order_id': order_id}
             assigned_table = getattr(order_manager, 'last_assigned_table', None)
             if assigned_table:
                 payload['table_number'] = assigned_table
+            _wake_order_feed()
             return jsonify(payload), 201
         else:
             message = order_manager.last_error or 'Không thể tạo đơn hàng trong database'
@@ -250,7 +671,7 @@ def create_order():
         return jsonify({'error': f'Lỗi server: {str(e)}'}), 500
 
 
-@app.route('/orders/<int:order_id>/items', methods=['PUT'])
+@bp.route('/orders/<int:order_id>/items', methods=['PUT'])
 def update_order_items(order_id):
     data = request.json or {}
     items = data.get('items')
@@ -271,11 +692,12 @@ def update_order_items(order_id):
             return jsonify({'error': 'Order not found'}), 404
         return jsonify({'error': 'Failed to update order items'}), 400
 
+    _wake_order_feed()
     refreshed = order_manager.get_order(order_id)
     return jsonify({'message': 'Order items updated', 'order': refreshed}), 200
 
 
-@app.route('/orders/<int:order_id>/confirm', methods=['POST'])
+@bp.route('/orders/<int:order_id>/confirm', methods=['POST'])
 def confirm_order(order_id):
     data = request.json or {}
     if any(key in data for key in ('items', 'note', 'table_number', 'customer_name', 'needs_assistance')):
@@ -291,27 +713,30 @@ def confirm_order(order_id):
             return jsonify({'error': 'Order not found'}), 404
         if details is None:
             return jsonify({'error': 'Failed to update order before confirmation'}), 400
+        _wake_order_feed()
 
     if not order_manager.update_order_status(order_id, 'confirmed'):
         if order_manager.get_order(order_id) is None:
             return jsonify({'error': 'Order not found'}), 404
         return jsonify({'error': 'Could not confirm order'}), 400
+    _wake_order_feed()
 
     refreshed = order_manager.get_order(order_id)
     return jsonify({'message': 'Order confirmed', 'order': refreshed}), 200
 
 
-@app.route('/orders/<int:order_id>/send-to-kitchen', methods=['POST'])
+@bp.route('/orders/<int:order_id>/send-to-kitchen', methods=['POST'])
 def send_order_to_kitchen(order_id):
     if not order_manager.update_order_status(order_id, 'sent_to_kitchen'):
         if order_manager.get_order(order_id) is None:
             return jsonify({'error': 'Order not found'}), 404
         return jsonify({'error': 'Could not send order to kitchen'}), 400
+    _wake_order_feed()
     refreshed = order_manager.get_order(order_id)
     return jsonify({'message': 'Order sent to kitchen', 'order': refreshed}), 200
 
 
-@app.route('/orders/<int:order_id>/status', methods=['POST'])
+@bp.route('/orders/<int:order_id>/status', methods=['POST'])
 def set_order_status(order_id):
     data = request.json or {}
     status = data.get('status')
@@ -325,6 +750,7 @@ def set_order_status(order_id):
             if order_manager.get_order(order_id) is None:
                 return jsonify({'error': 'Order not found'}), 404
             return jsonify({'error': 'Unable to mark order as served'}), 400
+        _wake_order_feed()
         return jsonify({'message': 'Order marked as served', 'qr_code_data': qr_data}), 200
 
     if not order_manager.update_order_status(order_id, status):
@@ -332,10 +758,11 @@ def set_order_status(order_id):
             return jsonify({'error': 'Order not found'}), 404
         return jsonify({'error': 'Unable to update order status'}), 400
     refreshed = order_manager.get_order(order_id)
+    _wake_order_feed()
     return jsonify({'message': 'Order status updated', 'order': refreshed}), 200
 
 
-@app.route('/orders/<int:order_id>/qr', methods=['GET'])
+@bp.route('/orders/<int:order_id>/qr', methods=['GET'])
 def get_order_qr(order_id):
     qr_data = order_manager.get_qr_code_data(order_id)
     if not qr_data:
@@ -343,7 +770,31 @@ def get_order_qr(order_id):
             return jsonify({'error': 'Order not found'}), 404
         return jsonify({'error': 'QR code not available'}), 404
     return jsonify({'qr_code_data': qr_data}), 200
-@app.route('/orders/<int:order_id>', methods=['PUT'])
+
+
+@bp.route('/orders/<int:order_id>/qr.<fmt>', methods=['GET'])
+def get_order_qr_image(order_id, fmt):
+    if fmt not in QR_FORMATS:
+        return jsonify({'error': 'Unsupported QR format'}), 404
+    qr_data = order_manager.get_qr_code_data(order_id)
+    if not qr_data:
+        if order_manager.get_order(order_id) is None:
+            return jsonify({'error': 'Order not found'}), 404
+        return jsonify({'error': 'QR code not available'}), 404
+    qr_service = order_manager.qr_service
+    etag = f'"{qr_service.etag(order_id, qr_data)}"'
+    headers = {'ETag': etag, 'Cache-Control': QR_CACHE_CONTROL}
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    try:
+        body = qr_service.get(order_id, qr_data, fmt)
+    except Exception as e:
+        print(f"Could not render QR for order {order_id}: {e}")
+        return jsonify({'error': 'Unable to render QR code'}), 500
+    return Response(body, status=200, headers=headers, mimetype=QR_FORMATS[fmt])
+
+
+@bp.route('/orders/<int:order_id>', methods=['PUT'])
 def update_order(order_id):
     data = request.json
     status = data.get('status')
@@ -352,17 +803,86 @@ def update_order(order_id):
 
     success = order_manager.update_order_status(order_id, status)
     if success:
+        _wake_order_feed()
         return jsonify({'message': 'Order updated successfully'})
     else:
         return jsonify({'error': 'Failed to update order'}), 500
 
-@app.route('/orders/<int:order_id>', methods=['DELETE'])
+@bp.route('/orders/<int:order_id>', methods=['DELETE'])
 def delete_order(order_id):
     success = order_manager.delete_order(order_id)
     if success:
+        _wake_order_feed()
         return jsonify({'message': 'Order deleted successfully'})
     else:
         return jsonify({'error': 'Failed to delete order'}), 500
 
+@bp.route('/events/orders', methods=['GET'])
+def stream_order_events():
+    """Server-Sent Events stream of order lifecycle events.
+
+    Clients resume with the standard Last-Event-ID header; a ``reset`` event
+    means the requested id is no longer buffered and the client should
+    resynchronize through GET /orders/changes.
+    """
+    # The stream outlives the app context, so hold the bus and feed themselves
+    bus = order_events._get_current_object()
+    feed = get_services().order_feed
+    raw_last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(raw_last_id) if raw_last_id else bus.last_id
+    except ValueError:
+        last_id = bus.last_id
+
+    def generate(last_id):
+        feed.subscribe()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events, reset = bus.wait_for_events(last_id, SSE_HEARTBEAT_SECONDS)
+                if reset:
+                    last_id = bus.last_id
+                    yield f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+                if not events:
+                    yield ': keep-alive\n\n'
+                    continue
+                for event in events:
+                    last_id = event['id']
+                    yield format_sse(event)
+        finally:
+            feed.unsubscribe()
+
+    response = Response(generate(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def create_app(config=None):
+    """Build the API app; the database and managers are created lazily per process.
+
+    ``config`` may set DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    SLOW_QUERY_MS, QUERY_DEBUG, N_PLUS_ONE_THRESHOLD, LOG_REQUEST_ID (prefix
+    print() lines with the request id by wrapping sys.stdout; off by default
+    so importing api leaves stdout alone, serve.py turns it on) or
+    SERVICES_FACTORY (a callable taking the app config and returning an
+    AppServices-like object, e.g. fakes in tests).
+    """
+    flask_app = Flask(__name__)
+    flask_app.json = TimedJSONProvider(flask_app)
+    if config:
+        flask_app.config.update(config)
+    CORS(flask_app, expose_headers=[request_context.REQUEST_ID_HEADER, 'Server-Timing', 'X-Next-After-Id'])
+    if flask_app.config.get('LOG_REQUEST_ID', False):
+        request_context.install_log_prefix()
+    flask_app.register_blueprint(bp)
+    return flask_app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    request_context.install_log_prefix()
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
@@ -0,0 +1,103 @@
+"""Catalog import throughput: bulk pipeline vs. one add_product call per row.
+
+Generates a synthetic menu file, imports it with catalog_io.import_catalog
+and (on a smaller sample) with ProductManager.add_product, prints rows/s for
+both, then deletes every product it created.
+
+Run from the App directory:
+    python -m benchmarks.catalog_import --rows 5000 --baseline-rows 200
+"""
+import argparse
+import csv
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from catalog_io import CATEGORIES, CSV_COLUMNS, IMPORT_CHUNK_SIZE, import_catalog
+from database import Database
+from product_manager import ProductManager
+
+TAGS = ['socola', 'dau', 'vani', 'it duong', 'cay', 'chay', 'lanh', 'nong']
+
+
+def synthetic_rows(count, seed=42):
+    rng = random.Random(seed)
+    for index in range(count):
+        yield {
+            'id': '',
+            'name': f"Bench item {index}",
+            'price': f"{rng.randint(10, 500) * 1000}",
+            'category': rng.choice(CATEGORIES),
+            'quantity': str(rng.randint(0, 100)),
+            'description': f"Mon thu nghiem so {index} voi huong vi dac biet",
+            'image_url': '',
+            'ai_keys': ';'.join(rng.sample(TAGS, rng.randint(0, 3))),
+            'keywords': '',
+        }
+
+
+def write_csv(path, count):
+    with open(path, 'w', encoding='utf-8', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(synthetic_rows(count))
+
+
+def delete_products(db, product_ids, chunk_size=1000):
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        db.cursor.execute(
+            f"DELETE FROM products WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+            tuple(chunk)
+        )
+        db.conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk catalog import')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--baseline-rows', type=int, default=200,
+                        help='Rows imported through add_product for comparison (0 to skip)')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = Database()
+    product_manager = ProductManager(db=db)
+    created = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'menu.csv'
+            write_csv(path, args.rows)
+            report = import_catalog(product_manager, str(path), chunk_size=args.chunk_size)
+            created.extend(report['product_ids'])
+            rate = report['imported'] / report['seconds'] if report['seconds'] else 0
+            print(f"{'bulk import':<20} {report['imported']:6d} rows in {report['seconds']:7.2f} s "
+                  f"= {rate:8.0f} rows/s (chunk {args.chunk_size})")
+
+        if args.baseline_rows > 0:
+            started = time.perf_counter()
+            for row in synthetic_rows(args.baseline_rows, seed=7):
+                attributes = {'ai_keys': row['ai_keys'].split(';')} if row['ai_keys'] else None
+                product_id = product_manager.add_product(
+                    row['name'], row['price'], row['category'], int(row['quantity']),
+                    row['description'], None, attributes
+                )
+                if product_id:
+                    created.append(product_id)
+            seconds = time.perf_counter() - started
+            print(f"{'add_product loop':<20} {args.baseline_rows:6d} rows in {seconds:7.2f} s "
+                  f"= {args.baseline_rows / seconds:8.0f} rows/s")
+    finally:
+        delete_products(db, created)
+        product_manager.catalog_cache.invalidate()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
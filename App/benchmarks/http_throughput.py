@@ -0,0 +1,73 @@
+"""HTTP throughput and latency of a running API server.
+
+Start the server under test first, e.g. the dev server (``python api.py``)
+or the production entry point (``python serve.py --workers 4 --threads 8``),
+then from the App directory:
+    python -m benchmarks.http_throughput --url http://127.0.0.1:5000/products --clients 32 --seconds 20
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(url, clients, seconds, headers):
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    start_at = time.monotonic()
+    stop_at = start_at + seconds
+
+    def worker(index):
+        request = urllib.request.Request(url, headers=headers)
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError):
+                errors[index] += 1
+                continue
+            latencies[index].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start_at
+    merged = sorted(value for values in latencies for value in values)
+    return {
+        'requests': len(merged),
+        'errors': sum(errors),
+        'rps': len(merged) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(merged, 0.50) * 1000,
+        'p95_ms': percentile(merged, 0.95) * 1000,
+        'p99_ms': percentile(merged, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure API throughput with concurrent clients')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/products')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--gzip', action='store_true', help='Send Accept-Encoding: gzip')
+    args = parser.parse_args()
+
+    headers = {'Accept-Encoding': 'gzip'} if args.gzip else {}
+    result = run(args.url, args.clients, args.seconds, headers)
+    print(f"{args.url} with {args.clients} clients for {args.seconds:.0f} s")
+    print(f"  {result['requests']} requests, {result['errors']} errors, {result['rps']:.1f} req/s")
+    print(f"  latency p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
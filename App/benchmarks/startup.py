@@ -0,0 +1,48 @@
+"""Measure Database() construction time with the migration runner.
+
+Run from the App directory:
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+import migrations
+from database import Database
+
+
+def time_construction(runs, per_process_cache):
+    samples = []
+    for _ in range(runs):
+        if not per_process_cache:
+            migrations._checked_databases.clear()
+        started = time.perf_counter()
+        db = Database()
+        samples.append((time.perf_counter() - started) * 1000)
+        db.close()
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<40} median {statistics.median(samples):8.1f} ms   max {max(samples):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Database() startup cost')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    # First construction applies any pending migrations
+    report("first start (may migrate)", time_construction(1, per_process_cache=False))
+    report("new process, schema current", time_construction(args.runs, per_process_cache=False))
+    report("same process, already checked", time_construction(args.runs, per_process_cache=True))
+
+
+if __name__ == '__main__':
+    main()
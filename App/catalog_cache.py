@@ -0,0 +1,98 @@
+"""Versioned in-process cache for materialized product catalog reads."""
+import os
+import threading
+import time
+
+DEFAULT_CATALOG_TTL = float(os.environ.get('WEB_STORE_CATALOG_TTL', '300'))
+ALL_CATEGORIES = '*'
+
+
+class CatalogCache:
+    """Per-category product lists invalidated by catalog writes.
+
+    Every write bumps ``version`` and drops all entries; entries also expire
+    after ``ttl`` seconds as a safety net for writes made by other processes.
+    """
+
+    def __init__(self, ttl=DEFAULT_CATALOG_TTL):
+        self.ttl = ttl
+        self.version = 1
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, category=None):
+        """Return the cached product list for ``category`` or None on a miss."""
+        key = category or ALL_CATEGORIES
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None:
+                self._hits += 1
+                return entry['products']
+            self._misses += 1
+            return None
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['version'] == self.version and (self.ttl <= 0 or time.monotonic() - entry['loaded_at'] < self.ttl):
+            return entry
+        del self._entries[key]
+        return None
+
+    def put(self, category, version, products):
+        """Store ``products`` loaded while the cache was at ``version``.
+
+        Loads that raced with a write are discarded so stale data never
+        outlives the invalidation.
+        """
+        with self._lock:
+            if version != self.version:
+                return False
+            self._entries[category or ALL_CATEGORIES] = {
+                'version': version,
+                'loaded_at': time.monotonic(),
+                'products': products,
+                'derived': {}
+            }
+            return True
+
+    def get_derived(self, category, name):
+        """Return a value derived from the cached ``category`` list (e.g. its JSON body)."""
+        with self._lock:
+            entry = self._live_entry(category or ALL_CATEGORIES)
+            if entry is None:
+                return None
+            return entry['derived'].get(name)
+
+    def put_derived(self, category, version, name, value):
+        """Attach ``value`` to the cached list; it expires and invalidates with it."""
+        with self._lock:
+            entry = self._live_entry(category or ALL_CATEGORIES)
+            if entry is None or entry['version'] != version:
+                return False
+            entry['derived'][name] = value
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._invalidations += 1
+            return self.version
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'version': self.version,
+                'ttl': self.ttl,
+                'entries': sorted(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self._invalidations
+            }
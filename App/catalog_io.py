@@ -0,0 +1,392 @@
+"""Streaming bulk import/export of the product catalog (CSV or JSONL).
+
+Rows are validated one at a time and written in chunks: one multi-row
+INSERT each for products, product_attributes and product_tags, committed per
+chunk. Product ids come from AUTO_INCREMENT as one consecutive block per
+chunk, so a chunk never needs per-row id lookups. Export pages through
+products by id and never holds the whole catalog in memory.
+
+Usage (from the App directory):
+    python catalog_io.py import menu.csv
+    python catalog_io.py import menu.jsonl --chunk-size 1000 --dry-run
+    python catalog_io.py export catalog.jsonl --category cake
+"""
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from mysql.connector import Error
+from text_utils import parse_ai_keys
+from product_manager import PRODUCT_CATEGORIES as CATEGORIES, legacy_ai_keys_value
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_PAGE_SIZE = 1000
+CSV_COLUMNS = ['id', 'name', 'price', 'category', 'quantity', 'description', 'image_url', 'ai_keys', 'keywords']
+MAX_REPORTED_ERRORS = 1000
+# product_attributes.attribute_type is VARCHAR(50)
+MAX_ATTRIBUTE_TYPE_LENGTH = 50
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        fmt = fmt.lower()
+    else:
+        fmt = 'jsonl' if Path(path).suffix.lower() in ('.jsonl', '.ndjson', '.json') else 'csv'
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported catalog format: {fmt}")
+    return fmt
+
+
+def read_rows(handle, fmt):
+    """Yield (line_number, raw_row) from an open CSV or JSONL file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(handle)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(handle, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f"invalid JSON: {e.msg}")
+            continue
+        if not isinstance(row, dict):
+            yield line_number, ValueError("expected a JSON object")
+            continue
+        yield line_number, row
+
+
+def _split_list(value):
+    if isinstance(value, str) and not value.strip().startswith('['):
+        return [item.strip() for item in value.replace(',', ';').split(';') if item.strip()]
+    return parse_ai_keys(value)
+
+
+def validate_row(raw):
+    """Return a normalized product row or raise ValueError listing every problem."""
+    errors = []
+    name = str(raw.get('name') or '').strip()
+    if not name:
+        errors.append("name is required")
+    elif len(name) > 255:
+        errors.append("name longer than 255 characters")
+
+    price = None
+    try:
+        price = Decimal(str(raw.get('price')).strip())
+        if not price.is_finite() or price < 0 or price >= Decimal('100000000'):
+            errors.append(f"price out of range: {raw.get('price')}")
+        price = price.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        errors.append(f"invalid price: {raw.get('price')!r}")
+
+    category = str(raw.get('category') or '').strip().lower()
+    if category not in CATEGORIES:
+        errors.append(f"category must be one of {', '.join(CATEGORIES)}")
+
+    quantity = raw.get('quantity')
+    if quantity in (None, ''):
+        quantity = 0
+    else:
+        try:
+            quantity = int(str(quantity).strip())
+            if quantity < 0:
+                errors.append("quantity must not be negative")
+        except ValueError:
+            errors.append(f"invalid quantity: {quantity!r}")
+
+    image_url = str(raw.get('image_url') or '').strip() or None
+    if image_url and len(image_url) > 255:
+        errors.append("image_url longer than 255 characters")
+
+    attributes = raw.get('attributes') if isinstance(raw.get('attributes'), dict) else {}
+    tags = sorted(set(_split_list(raw.get('ai_keys') or attributes.get('ai_keys'))))
+    if any(len(tag) > 255 for tag in tags):
+        errors.append("ai_keys entries must be at most 255 characters")
+    long_keys = [str(key) for key in attributes if len(str(key).strip()) > MAX_ATTRIBUTE_TYPE_LENGTH]
+    if long_keys:
+        errors.append(f"attribute names must be at most {MAX_ATTRIBUTE_TYPE_LENGTH} characters: "
+                      + ", ".join(key[:60] for key in long_keys))
+
+    if errors:
+        raise ValueError("; ".join(errors))
+
+    description = str(raw.get('description') or '').strip() or None
+    extra = {
+        attr_type: _split_list(values)
+        for attr_type, values in attributes.items()
+        if attr_type not in ('ai_keys', 'name', 'keywords')
+    }
+    keywords = _split_list(raw.get('keywords') or attributes.get('keywords'))
+    return {
+        'name': name,
+        'price': price,
+        'category': category,
+        'quantity': quantity,
+        'description': description,
+        'image_url': image_url,
+        'keywords': keywords,
+        'extra_attributes': extra,
+        'ai_keys': tags,
+    }
+
+
+def _attribute_rows(product_manager, product_id, row):
+    """Same attribute rows add_product would store for ``row``."""
+    attributes = product_manager._extract_attributes_from_text(row['name'], row['description'])
+    for value in row['keywords']:
+        if value not in attributes['keywords']:
+            attributes['keywords'].append(value)
+    for attr_type, values in row['extra_attributes'].items():
+        attributes.setdefault(attr_type, []).extend(values)
+    return [
+        (product_id, attr_type, value.strip()[:255])
+        for attr_type, values in attributes.items()
+        for value in values
+        if value and isinstance(value, str) and value.strip()
+    ]
+
+
+def _insert_chunk(product_manager, rows, id_step):
+    """Insert ``rows`` in one transaction; return their new product ids."""
+    conn = product_manager.db.conn
+    cursor = conn.cursor()
+    # Pooled connections run in autocommit mode: without an explicit
+    # transaction a failed attribute/tag insert would leave the products behind
+    conn.start_transaction()
+    try:
+        columns = ['name', 'price', 'category', 'quantity', 'description', 'image_url']
+        # Keep the legacy JSON copy in step with product_tags until migration 7
+        legacy = product_manager.has_legacy_ai_keys_column()
+        if legacy:
+            columns.append('ai_keys')
+        placeholders = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))
+        values = []
+        for row in rows:
+            values.extend((
+                row['name'], row['price'], row['category'], row['quantity'],
+                row['description'], row['image_url']
+            ))
+            if legacy:
+                values.append(legacy_ai_keys_value(row['ai_keys']))
+        cursor.execute(
+            f"INSERT INTO products ({', '.join(columns)}) VALUES {placeholders}",
+            tuple(values)
+        )
+        # A multi-row VALUES insert is a "simple insert": InnoDB hands it one
+        # consecutive block of ids starting at LAST_INSERT_ID().
+        first_id = cursor.lastrowid
+        ids = [first_id + index * id_step for index in range(len(rows))]
+
+        attr_values = []
+        tag_values = []
+        for product_id, row in zip(ids, rows):
+            attr_values.extend(_attribute_rows(product_manager, product_id, row))
+            tag_values.extend((product_id, tag) for tag in row['ai_keys'])
+        if attr_values:
+            cursor.execute(
+                "INSERT INTO product_attributes (product_id, attribute_type, attribute_value) VALUES "
+                + ", ".join(["(%s, %s, %s)"] * len(attr_values)),
+                tuple(value for triple in attr_values for value in triple)
+            )
+        if tag_values:
+            cursor.execute(
+                "INSERT INTO product_tags (product_id, tag) VALUES "
+                + ", ".join(["(%s, %s)"] * len(tag_values)),
+                tuple(value for pair in tag_values for value in pair)
+            )
+        conn.commit()
+        return ids
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_catalog(product_manager, source, fmt=None, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False, progress=None):
+    """Import products from a CSV/JSONL path.
+
+    Invalid rows are skipped and reported; a chunk rejected by MySQL is
+    retried row by row so only the offending rows fail. Returns a report dict
+    with ``imported``, ``failed``, ``errors`` (``{'row', 'error'}``),
+    ``product_ids`` and ``seconds``.
+    """
+    fmt = detect_format(source, fmt)
+    started = time.perf_counter()
+    report = {'imported': 0, 'failed': 0, 'errors': [], 'product_ids': [], 'seconds': 0.0}
+
+    def fail(line_number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': line_number, 'error': message})
+
+    id_step = 1
+    if not dry_run:
+        product_manager.ensure_connection()
+        product_manager.db.cursor.execute("SELECT @@auto_increment_increment")
+        id_step = product_manager.db.cursor.fetchone()[0] or 1
+
+    def flush(batch):
+        if not batch:
+            return
+        if dry_run:
+            report['imported'] += len(batch)
+            return
+        try:
+            ids = _insert_chunk(product_manager, [row for _, row in batch], id_step)
+        except Error as e:
+            if len(batch) == 1:
+                fail(batch[0][0], f"database error: {e}")
+                return
+            for item in batch:
+                flush([item])
+            return
+        report['imported'] += len(ids)
+        report['product_ids'].extend(ids)
+        if progress:
+            progress(report['imported'], report['failed'])
+
+    batch = []
+    with open(source, 'r', encoding='utf-8-sig', newline='') as handle:
+        for line_number, raw in read_rows(handle, fmt):
+            if isinstance(raw, Exception):
+                fail(line_number, str(raw))
+                continue
+            try:
+                batch.append((line_number, validate_row(raw)))
+            except ValueError as e:
+                fail(line_number, str(e))
+                continue
+            if len(batch) >= chunk_size:
+                flush(batch)
+                batch = []
+        flush(batch)
+
+    if report['imported'] and not dry_run:
+        product_manager.catalog_cache.invalidate()
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def iter_catalog(db, category=None, page_size=EXPORT_PAGE_SIZE):
+    """Yield products (with attributes and ai_keys) page by page in id order."""
+    last_id = 0
+    while True:
+        cursor = db.conn.cursor(dictionary=True)
+        try:
+            sql = ("SELECT id, name, price, category, quantity, description, image_url "
+                   "FROM products WHERE id > %s")
+            params = [last_id]
+            if category:
+                sql += " AND category = %s"
+                params.append(category)
+            cursor.execute(sql + " ORDER BY id LIMIT %s", tuple(params + [page_size]))
+            products = cursor.fetchall()
+            if not products:
+                return
+            first_id, last_id = products[0]['id'], products[-1]['id']
+            attributes = {}
+            cursor.execute(
+                "SELECT product_id, attribute_type, attribute_value FROM product_attributes "
+                "WHERE product_id BETWEEN %s AND %s ORDER BY product_id, id",
+                (first_id, last_id)
+            )
+            for row in cursor:
+                if row['attribute_type'] == 'ai_keys':
+                    continue  # legacy copy; tags come from product_tags
+                attributes.setdefault(row['product_id'], {}).setdefault(
+                    row['attribute_type'], []).append(row['attribute_value'])
+            tags = {}
+            cursor.execute(
+                "SELECT product_id, tag FROM product_tags WHERE product_id BETWEEN %s AND %s "
+                "ORDER BY product_id, tag",
+                (first_id, last_id)
+            )
+            for row in cursor:
+                tags.setdefault(row['product_id'], []).append(row['tag'])
+        finally:
+            cursor.close()
+            db.release()
+
+        for product in products:
+            product['attributes'] = attributes.get(product['id'], {})
+            product['ai_keys'] = tags.get(product['id'], [])
+            yield product
+        if len(products) < page_size:
+            return
+
+
+def export_catalog(db, destination, fmt=None, category=None):
+    """Stream the catalog to a CSV/JSONL path; returns the number of products written."""
+    fmt = detect_format(destination, fmt)
+    written = 0
+    with open(destination, 'w', encoding='utf-8', newline='') as handle:
+        writer = None
+        if fmt == 'csv':
+            writer = csv.DictWriter(handle, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+        for product in iter_catalog(db, category=category):
+            if writer:
+                writer.writerow({
+                    'id': product['id'],
+                    'name': product['name'],
+                    'price': product['price'],
+                    'category': product['category'],
+                    'quantity': product['quantity'],
+                    'description': product['description'] or '',
+                    'image_url': product['image_url'] or '',
+                    'ai_keys': ';'.join(product['ai_keys']),
+                    'keywords': ';'.join(product['attributes'].get('keywords', [])),
+                })
+            else:
+                product['price'] = str(product['price'])
+                handle.write(json.dumps(product, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+def _print_progress(imported, failed):
+    print(f"Imported {imported} products ({failed} rows rejected)")
+
+
+if __name__ == '__main__':
+    import argparse
+    from database import Database
+    from product_manager import ProductManager
+
+    parser = argparse.ArgumentParser(description='Bulk catalog import/export')
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_parser = sub.add_parser('import', help='Import products from CSV/JSONL')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'))
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    import_parser.add_argument('--dry-run', action='store_true', help='Validate only, write nothing')
+    export_parser = sub.add_parser('export', help='Export products to CSV/JSONL')
+    export_parser.add_argument('path')
+    export_parser.add_argument('--format', choices=('csv', 'jsonl'))
+    export_parser.add_argument('--category', choices=CATEGORIES)
+    args = parser.parse_args()
+
+    db = Database()
+    try:
+        if args.command == 'import':
+            result = import_catalog(ProductManager(db=db), args.path, fmt=args.format,
+                                    chunk_size=max(1, args.chunk_size), dry_run=args.dry_run,
+                                    progress=_print_progress)
+            for error in result['errors']:
+                print(f"Row {error['row']}: {error['error']}")
+            rate = result['imported'] / result['seconds'] if result['seconds'] else 0
+            print(f"Done: {result['imported']} imported, {result['failed']} rejected "
+                  f"in {result['seconds']:.2f} s ({rate:.0f} rows/s)")
+            sys.exit(1 if result['failed'] else 0)
+        else:
+            count = export_catalog(db, args.path, fmt=args.format, category=args.category)
+            print(f"Exported {count} products to {args.path}")
+    finally:
+        db.close()
@@ -1,52 +1,354 @@
 import mysql.connector
-import json
-from pathlib import Path
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from migrations import run_migrations
+from request_context import current_request_id
+from query_stats import (
+    QueryScope, find_caller, sql_shape, SLOW_QUERY_MS, QUERY_DEBUG, N_PLUS_ONE_THRESHOLD
+)
+
+DB_HOST = os.environ.get('WEB_STORE_DB_HOST', 'localhost')
+DB_USER = os.environ.get('WEB_STORE_DB_USER', 'root')
+DB_NAME = os.environ.get('WEB_STORE_DB_NAME', 'web_store')
+# Try common credential sets (prefer empty password for XAMPP)
+DB_PASSWORDS = ['', 'mysql', 'root']
+
+DEFAULT_POOL_SIZE = int(os.environ.get('WEB_STORE_DB_POOL_SIZE', '5'))
+DEFAULT_MAX_OVERFLOW = int(os.environ.get('WEB_STORE_DB_MAX_OVERFLOW', '10'))
+DEFAULT_POOL_TIMEOUT = float(os.environ.get('WEB_STORE_DB_POOL_TIMEOUT', '30'))
+# Idle connections older than this are pinged before being handed out
+DEFAULT_PING_AFTER = float(os.environ.get('WEB_STORE_DB_PING_AFTER', '5'))
+
+# Pools inherited across fork(). Their sockets belong to the parent process:
+# closing (or garbage-collecting) them in a child would end the parent's
+# MySQL sessions, so children keep them referenced and never touch them.
+_inherited_pools = []
+
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections.
+
+    Keeps up to ``size`` idle connections, allows ``max_overflow`` extra
+    connections under load and makes borrowers wait up to ``timeout`` seconds
+    once both are exhausted.
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+                 timeout=DEFAULT_POOL_TIMEOUT, ping_after=DEFAULT_PING_AFTER):
+        self._factory = factory
+        self.size = max(1, int(size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._open = 0
+        self._checked_out = 0
+        self._closed = False
+        self._counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'wait_seconds': 0.0,
+            'peak_checked_out': 0
+        }
+
+    def acquire(self):
+        conn = None
+        reuse = False
+        with self._cond:
+            deadline = None
+            waited_since = None
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    reuse = True
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                if deadline is None:
+                    waited_since = time.monotonic()
+                    deadline = waited_since + self.timeout
+                    self._counters['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    self._counters['wait_seconds'] += time.monotonic() - waited_since
+                    raise PoolError(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"({self._checked_out} in use)"
+                    )
+                self._cond.wait(remaining)
+            if waited_since is not None:
+                self._counters['wait_seconds'] += time.monotonic() - waited_since
+            self._checked_out += 1
+            self._counters['checkouts'] += 1
+            if self._checked_out > self._counters['peak_checked_out']:
+                self._counters['peak_checked_out'] = self._checked_out
+
+        if reuse and time.monotonic() - returned_at >= self.ping_after and not self._is_healthy(conn):
+            self._close_quietly(conn)
+            with self._cond:
+                self._counters['discarded'] += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._checked_out -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._counters['created'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        if conn is None:
+            return
+        keep = False
+        with self._cond:
+            self._checked_out -= 1
+            if not discard and not self._closed and len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                keep = True
+            else:
+                self._open -= 1
+                if discard:
+                    self._counters['discarded'] += 1
+            self._cond.notify()
+        if not keep:
+            self._close_quietly(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'timeout': self.timeout,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'overflow_in_use': max(0, self._open - self.size),
+                'closed': self._closed
+            })
+        stats['wait_seconds'] = round(stats['wait_seconds'], 6)
+        return stats
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+
+def _tag_with_request_id(operation):
+    """Prefix SQL sent during an API request with ``/* request_id=... */``."""
+    request_id = current_request_id()
+    if request_id is None or not isinstance(operation, str):
+        return operation
+    return f"/* request_id={request_id} */ {operation}"
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times each statement and reports it to the Database.
+
+    The server sees statements tagged with the current request id; observers
+    get the untagged SQL so labels and shapes stay low-cardinality.
+    """
+
+    __slots__ = ('_cursor', '_db')
+
+    def __init__(self, cursor, db):
+        self._cursor = cursor
+        self._db = db
+
+    def execute(self, operation, params=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(_tag_with_request_id(operation), params, **kwargs)
+        except Exception as e:
+            self._db._record_query(operation, time.perf_counter() - started, e)
+            raise
+        self._db._record_query(operation, time.perf_counter() - started)
+        return result
+
+    def executemany(self, operation, seq_params, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = self._cursor.executemany(_tag_with_request_id(operation), seq_params, **kwargs)
+        except Exception as e:
+            self._db._record_query(operation, time.perf_counter() - started, e)
+            raise
+        self._db._record_query(operation, time.perf_counter() - started)
+        return result
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursors."""
+
+    __slots__ = ('_conn', '_db')
+
+    def __init__(self, conn, db):
+        self._conn = conn
+        self._db = db
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._db)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
 
 class Database:
-    def __init__(self):
-        self.conn = None
-        self.cursor = None
+    """Pooled access to the web_store database.
+
+    ``conn`` and ``cursor`` are bound to the calling thread: the first access
+    borrows a connection from the pool and ``release()`` hands it back, so
+    concurrent request threads never share a cursor. Statements run through
+    ``conn``/``cursor`` are timed and passed to the query observers,
+    statements slower than ``slow_query_ms`` are logged with their shape and
+    caller, and query scopes count what each request runs.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+                 pool_timeout=DEFAULT_POOL_TIMEOUT, slow_query_ms=SLOW_QUERY_MS,
+                 query_debug=QUERY_DEBUG, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self._local = threading.local()
+        # Kept apart from _local, which connect()/reset_after_fork() replace
+        self._scopes = threading.local()
+        self._password = None
+        self.pool = None
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self._query_observers = []
+        self.slow_query_ms = slow_query_ms
+        self.query_debug = query_debug
+        self.n_plus_one_threshold = n_plus_one_threshold
         self.connect()
-        
-    def connect(self):
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.pool is None:
+                return None
+            conn = self.pool.acquire()
+            self._local.conn = conn
+            self._local.cursor = None
+            self._local.proxy = InstrumentedConnection(conn, self)
+        return self._local.proxy
+
+    @property
+    def cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            conn = self.conn
+            if conn is None:
+                return None
+            cursor = conn.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def _open_connection(self):
+        conn = mysql.connector.connect(
+            host=DB_HOST,
+            user=DB_USER,
+            password=self._password,
+            database=DB_NAME,
+            charset='utf8mb4',
+            autocommit=True
+        )
         try:
-            # Try common credential sets (prefer empty password for XAMPP)
-            last_error = None
-            for pwd in ['', 'mysql', 'root']:
-                try:
-                    self.conn = mysql.connector.connect(
-                        host='localhost',
-                        user='root',
-                        password=pwd,
-                        charset='utf8mb4',
-                        autocommit=True
-                    )
-                    break
-                except Error as e:
-                    last_error = e
-                    self.conn = None
-            if not self.conn:
-                raise last_error if last_error else Error("Unable to connect to MySQL with tried credentials")
-            
-            # Create cursor
-            self.cursor = self.conn.cursor()
+            conn.autocommit = True
+        except AttributeError:
+            pass
+        return conn
+
+    def _resolve_password(self):
+        last_error = None
+        for pwd in DB_PASSWORDS:
             try:
-                self.conn.autocommit = True
-            except AttributeError:
-                pass
-            
+                probe = mysql.connector.connect(
+                    host=DB_HOST,
+                    user=DB_USER,
+                    password=pwd,
+                    charset='utf8mb4',
+                    autocommit=True
+                )
+            except Error as e:
+                last_error = e
+                continue
+            probe.close()
+            return pwd
+        raise last_error if last_error else Error("Unable to connect to MySQL with tried credentials")
+
+    def connect(self):
+        try:
+            if self._password is None:
+                self._password = self._resolve_password()
+
+            if self.pool is not None:
+                self.pool.close()
+            self.pool = ConnectionPool(
+                self._open_connection,
+                size=self.pool_size,
+                max_overflow=self.max_overflow,
+                timeout=self.pool_timeout
+            )
+            self._local = threading.local()
+
             # Drop and recreate database
             # self.cursor.execute("DROP DATABASE IF EXISTS web_store")
             # self.cursor.execute("CREATE DATABASE web_store")
-            self.cursor.execute("USE web_store")
             print("Database connection established and using existing database")
-            
+
             # Create tables
-            self.create_tables()
-            
+            try:
+                self.create_tables()
+            finally:
+                self.release()
+
             print("Database connection successful")
-            
+
         except Error as e:
             print("\nError connecting to MySQL. Please check your MySQL configuration:")
             print("1. Make sure XAMPP/MySQL is running")
@@ -54,7 +356,7 @@ class Database:
             print("   - Username: root")
             print("   - Password: (empty)")
             print(f"\nError details: {str(e)}")
-            
+
             # Additional help for XAMPP users
             print("\nTo fix this:")
             print("1. Open XAMPP Control Panel")
@@ -67,284 +369,134 @@ class Database:
 
     def create_tables(self):
         try:
-            # Create products table with quantity field
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INT PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    price DECIMAL(10, 2) NOT NULL,
-                    category ENUM('cake', 'food', 'drink') NOT NULL,
-                    description TEXT,
-                    image_url VARCHAR(255),
-                    quantity INT DEFAULT 0,
-                    is_available BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Ensure optional columns exist on products
-            try:
-                self.cursor.execute("DESCRIBE products")
-                product_columns = {row[0] for row in self.cursor.fetchall()}
-                if 'ai_keys' not in product_columns:
-                    # Store as TEXT (JSON-encoded array)
-                    self.cursor.execute("ALTER TABLE products ADD COLUMN ai_keys TEXT NULL")
-                    self.conn.commit()
-                    print("Added column 'ai_keys' to products table")
-            except Error as e:
-                print(f"Warning: Could not verify/alter products table for ai_keys column: {e}")
-            
-            # Create product_attributes table for filters
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS product_attributes (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    product_id INT,
-                    attribute_type VARCHAR(50),
-                    attribute_value VARCHAR(255),
-                    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-                )
-            ''')
-
-            # Optional backfill: populate products.ai_keys from product_attributes
-            try:
-                # Only run if ai_keys column exists
-                self.cursor.execute("DESCRIBE products")
-                product_columns = {row[0] for row in self.cursor.fetchall()}
-                if 'ai_keys' in product_columns:
-                    # Fetch all product ids
-                    self.cursor.execute("SELECT id FROM products")
-                    product_ids = [row[0] for row in self.cursor.fetchall()]
-                    for pid in product_ids:
-                        self.cursor.execute(
-                            "SELECT attribute_value FROM product_attributes WHERE product_id = %s AND attribute_type = %s",
-                            (pid, 'ai_keys')
-                        )
-                        keys = [row[0] for row in self.cursor.fetchall() if row and row[0]]
-                        # Only update if we have keys and the current column is NULL or different
-                        if keys:
-                            keys_json = json.dumps(sorted(list(set(keys))))
-                            # Check current value
-                            self.cursor.execute("SELECT ai_keys FROM products WHERE id = %s", (pid,))
-                            current = self.cursor.fetchone()
-                            current_val = current[0] if current else None
-                            if current_val != keys_json:
-                                self.cursor.execute("UPDATE products SET ai_keys = %s WHERE id = %s", (keys_json, pid))
-                    self.conn.commit()
-            except Error as e:
-                print(f"Warning: Could not backfill products.ai_keys: {e}")
-            
-            # Create orders table
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INT PRIMARY KEY,
-                    customer_name VARCHAR(255) NOT NULL,
-                    total_price DECIMAL(10, 2) NOT NULL,
-                    status ENUM('pending', 'confirmed', 'sent_to_kitchen', 'processing', 'completed', 'cancelled', 'served') DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Ensure extended order columns exist
-            try:
-                self.cursor.execute("DESCRIBE orders")
-                order_columns = {row[0] for row in self.cursor.fetchall()}
-                alter_stmts = []
-                desired_statuses = (
-                    "pending",
-                    "confirmed",
-                    "sent_to_kitchen",
-                    "processing",
-                    "completed",
-                    "cancelled",
-                    "served"
-                )
-                self.cursor.execute("SHOW COLUMNS FROM orders LIKE 'status'")
-                status_column = self.cursor.fetchone()
-                if status_column:
-                    column_type = status_column[1].lower()
-                    if not all(status in column_type for status in desired_statuses):
-                        enum_values = ", ".join(f"'{status}'" for status in desired_statuses)
-                        self.cursor.execute(
-                            f"ALTER TABLE orders MODIFY status ENUM({enum_values}) DEFAULT 'pending'"
-                        )
-                        self.conn.commit()
-                if 'order_type' not in order_columns:
-                    alter_stmts.append("ADD COLUMN order_type VARCHAR(20) NULL")
-                if 'payment_method' not in order_columns:
-                    alter_stmts.append("ADD COLUMN payment_method VARCHAR(20) NULL")
-                if 'table_number' not in order_columns:
-                    alter_stmts.append("ADD COLUMN table_number VARCHAR(50) NULL")
-                if 'needs_assistance' not in order_columns:
-                    alter_stmts.append("ADD COLUMN needs_assistance BOOLEAN DEFAULT FALSE")
-                if 'note' not in order_columns:
-                    alter_stmts.append("ADD COLUMN note TEXT NULL")
-                if 'customer_email' not in order_columns:
-                    alter_stmts.append("ADD COLUMN customer_email VARCHAR(255) NULL")
-                if 'email_receipt' not in order_columns:
-                    alter_stmts.append("ADD COLUMN email_receipt BOOLEAN DEFAULT FALSE")
-                if 'payment_status' not in order_columns:
-                    alter_stmts.append("ADD COLUMN payment_status ENUM('unpaid','paid') DEFAULT 'unpaid'")
-                if 'qr_code_data' not in order_columns:
-                    alter_stmts.append("ADD COLUMN qr_code_data TEXT NULL")
-                if alter_stmts:
-                    stmt = "ALTER TABLE orders " + ", ".join(alter_stmts)
-                    self.cursor.execute(stmt)
-                    self.conn.commit()
-            except Error as e:
-                print(f"Warning: Could not alter orders table: {e}")
-
-            # Create dining tables table and seed data if needed
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS dining_tables (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    table_number VARCHAR(50) NOT NULL UNIQUE,
-                    display_name VARCHAR(100) NOT NULL,
-                    is_occupied BOOLEAN NOT NULL DEFAULT FALSE,
-                    current_order_id INT NULL,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    CONSTRAINT fk_dining_tables_order
-                        FOREIGN KEY (current_order_id) REFERENCES orders(id)
-                        ON DELETE SET NULL
-                )
-            ''')
-            self._seed_tables_if_needed()
-            
-            # Create order_items table
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS order_items (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    order_id INT,
-                    product_id INT,
-                    quantity INT,
-                    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-                    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-                )
-            ''')
-
-            # Ensure selected options column exists for order_items
-            try:
-                self.cursor.execute("DESCRIBE order_items")
-                item_columns = {row[0] for row in self.cursor.fetchall()}
-                if 'selected_options' not in item_columns:
-                    self.cursor.execute("ALTER TABLE order_items ADD COLUMN selected_options TEXT NULL")
-                    self.conn.commit()
-            except Error as e:
-                print(f"Warning: Could not alter order_items table: {e}")
-
-            # Check if users table exists and has correct structure
-            self.cursor.execute("SHOW TABLES LIKE 'users'")
-            if self.cursor.fetchone():
-                self.cursor.execute("DESCRIBE users")
-                columns = [row[0] for row in self.cursor.fetchall()]
-                if 'name' not in columns or 'email' not in columns or 'password_hash' not in columns:
-                    print("Dropping users table due to missing required columns")
-                    self.cursor.execute("DROP TABLE users")
-                    self.conn.commit()
-
-            # Create users table for authentication
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    email VARCHAR(255) NOT NULL UNIQUE,
-                    password_hash VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Verify table structure
-            self.cursor.execute("DESCRIBE users")
-            columns = [row[0] for row in self.cursor.fetchall()]
-            print("Users table columns:", columns)
-            
-            self.conn.commit()
-            print("Tables created successfully")
-            
+            with self.query_scope('migrations'):
+                run_migrations(self.cursor, self.conn, database_key=(DB_HOST, DB_NAME))
         except Error as e:
             print(f"Error creating tables: {e}")
             raise
 
-    def _load_table_seed_entries(self):
-        config_path = Path(__file__).resolve().parent / "config" / "tables.json"
-        try:
-            with open(config_path, "r", encoding="utf-8") as handle:
-                data = json.load(handle)
-            tables = data.get("tables", [])
-            result = []
-            for entry in tables:
-                number = entry.get("number") or entry.get("id")
-                name = entry.get("name")
-                if number is None:
-                    continue
-                number_text = str(number).strip()
-                if not number_text:
-                    continue
-                if not name:
-                    name = f"Ban {number_text}"
-                result.append({"number": number_text, "name": name})
-            return result
-        except FileNotFoundError:
-            return []
-        except Exception as exc:
-            print(f"Warning: Could not load table configuration: {exc}")
-            return []
-
-    def _seed_tables_if_needed(self):
-        try:
-            self.cursor.execute("SELECT COUNT(*) FROM dining_tables")
-            current = self.cursor.fetchone()
-            current_count = current[0] if current else 0
-            if current_count and current_count > 0:
-                return
-            seed_entries = self._load_table_seed_entries()
-            if not seed_entries:
-                seed_entries = [{"number": str(i), "name": f"Ban {i}"} for i in range(1, 13)]
-            insert_sql = "INSERT INTO dining_tables (table_number, display_name) VALUES (%s, %s)"
-            values = [(entry["number"], entry["name"]) for entry in seed_entries]
-            self.cursor.executemany(insert_sql, values)
-            self.conn.commit()
-            print(f"Seeded {len(values)} dining tables from configuration")
-        except Error as exc:
-            print(f"Warning: Could not seed dining tables: {exc}")
-
-    def get_next_id(self, table='products'):
-        try:
-            # Get list of all IDs from specified table
-            self.cursor.execute(f"SELECT id FROM {table} ORDER BY id")
-            ids = [row[0] for row in self.cursor.fetchall()]
-            
-            if not ids:
-                return 1  # First record
-            
-            # Find first gap in sequence
-            expected_id = 1
-            for current_id in ids:
-                if current_id != expected_id:
-                    return expected_id
-                expected_id += 1
-            
-            # If no gaps, return next number
-            return expected_id
-            
-        except Error as e:
-            print(f"Error getting next ID for {table}: {e}")
-            return None
-
     def reconnect_if_needed(self):
         try:
-            if self.conn is None or not self.conn.is_connected():
+            conn = getattr(self._local, 'conn', None)
+            if self.pool is None:
                 print("Reconnecting to database...")
                 self.connect()
+            elif conn is not None and not conn.is_connected():
+                print("Reconnecting to database...")
+                self.release(discard=True)
         except Error as e:
             print(f"Error reconnecting: {e}")
             raise
 
+    def release(self, discard=False):
+        """Return the calling thread's connection to the pool."""
+        local = getattr(self, '_local', None)
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            return
+        cursor = getattr(local, 'cursor', None)
+        local.conn = None
+        local.cursor = None
+        local.proxy = None
+        try:
+            if cursor:
+                cursor.close()
+        except Error:
+            discard = True
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except Error:
+                discard = True
+        self.pool.release(conn, discard=discard)
+
+    def add_query_observer(self, observer):
+        """Call ``observer(sql, seconds, error)`` after every statement."""
+        if observer not in self._query_observers:
+            self._query_observers.append(observer)
+
+    def begin_query_scope(self, label):
+        """Start counting the calling thread's statements (nested scopes stack)."""
+        scope = QueryScope(label, track_shapes=self.query_debug,
+                           parent=getattr(self._scopes, 'current', None))
+        self._scopes.current = scope
+        return scope
+
+    def end_query_scope(self):
+        """Stop the innermost scope of the calling thread and return it (None if none).
+
+        A nested scope's counts are added to the enclosing one, so e.g. a
+        request's totals include migrations run during its first DB access.
+        """
+        scope = getattr(self._scopes, 'current', None)
+        if scope is not None:
+            parent = scope.parent
+            self._scopes.current = parent
+            scope.parent = None
+            if parent is not None:
+                for shape, runs in scope.merge_into(parent, self.n_plus_one_threshold):
+                    print(f"Possible N+1 query in {parent.label}: ran {runs} times "
+                          f"(including {scope.label}): {shape}")
+        return scope
+
+    def current_query_scope(self):
+        return getattr(self._scopes, 'current', None)
+
+    @contextmanager
+    def query_scope(self, label):
+        scope = self.begin_query_scope(label)
+        try:
+            yield scope
+        finally:
+            if self.current_query_scope() is scope:
+                self.end_query_scope()
+
+    def _record_query(self, sql, seconds, error=None):
+        scope = getattr(self._scopes, 'current', None)
+        if scope is not None:
+            runs = scope.add(sql, seconds, error)
+            # Warn once per statement shape, when it crosses the threshold
+            if runs == self.n_plus_one_threshold + 1:
+                print(f"Possible N+1 query in {scope.label}: ran {runs} times, last from "
+                      f"{find_caller()}: {sql_shape(sql)}")
+        if self.slow_query_ms and seconds * 1000 >= self.slow_query_ms:
+            where = f" in {scope.label}" if scope is not None else ""
+            print(f"Slow query ({seconds * 1000:.1f} ms){where} from {find_caller()}: {sql_shape(sql)}")
+        for observer in self._query_observers:
+            try:
+                observer(sql, seconds, error)
+            except Exception as e:
+                print(f"Query observer failed: {e}")
+
+    def reset_after_fork(self):
+        """Start a fresh, empty pool in a forked child process.
+
+        Pre-fork servers call this in each worker; connections inherited from
+        the parent are abandoned rather than closed.
+        """
+        if self.pool is not None:
+            _inherited_pools.append((self.pool, self._local))
+        self._local = threading.local()
+        self.pool = ConnectionPool(
+            self._open_connection,
+            size=self.pool_size,
+            max_overflow=self.max_overflow,
+            timeout=self.pool_timeout
+        )
+
+    def pool_stats(self):
+        if self.pool is None:
+            return {}
+        return self.pool.stats()
+
     def close(self):
         try:
-            if self.conn and self.conn.is_connected():
-                if self.cursor:
-                    self.cursor.close()
-                self.conn.close()
+            pool = getattr(self, 'pool', None)
+            if pool is not None:
+                self.release()
+                pool.close()
+                self.pool = None
                 print("Database connection closed")
         except Error as e:
             print(f"Error closing connection: {e}")
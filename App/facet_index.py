@@ -0,0 +1,55 @@
+"""ai_keys facet index over the materialized product catalog."""
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+
+class FacetIndex:
+    """Facet value -> set of product ids, overall and per category.
+
+    Filtering touches only the sets of the selected keys, so it costs
+    O(selected keys) set operations instead of a scan over every product.
+    """
+
+    def __init__(self, products, facet='ai_keys'):
+        self.facet = facet
+        self._by_category = {}
+        self._all = {}
+        for product in products:
+            product_id = product['id']
+            category = product.get('category')
+            filters = product.get('filters') if isinstance(product.get('filters'), dict) else {}
+            for key in filters.get(facet) or []:
+                self._all.setdefault(key, set()).add(product_id)
+                self._by_category.setdefault(category, {}).setdefault(key, set()).add(product_id)
+
+    def _sets(self, category=None):
+        return self._by_category.get(category, {}) if category else self._all
+
+    def options(self, category=None):
+        """Sorted facet values available in ``category`` (all categories if None)."""
+        return sorted(self._sets(category))
+
+    def matching_ids(self, keys, match=MATCH_ALL, category=None):
+        """Ids of products having all (or any) of ``keys``; None means no facet filter."""
+        keys = [key for key in dict.fromkeys(keys or []) if key]
+        if not keys:
+            return None
+        sets = self._sets(category)
+        selected = [sets.get(key, set()) for key in keys]
+        if match == MATCH_ANY:
+            return set().union(*selected)
+        selected.sort(key=len)
+        result = set(selected[0])
+        for ids in selected[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def counts(self, category=None, within=None):
+        """Products per facet value, optionally restricted to the ids in ``within``."""
+        sets = self._sets(category)
+        if within is None:
+            return {key: len(ids) for key, ids in sets.items()}
+        return {key: len(ids & within) for key, ids in sets.items()}
@@ -7,6 +7,11 @@ import json
 from datetime import datetime
 from product_manager import ProductManager
 from order_manager import OrderManager
+from tk_background import TkBackgroundRunner
+from image_previews import PreviewCache, preview_key, render_preview
+import image_variants
+
+PRODUCT_SEARCH_DEBOUNCE_MS = 250
 
 class StoreGUI:
     def __init__(self, root):
@@ -21,6 +26,16 @@ class StoreGUI:
 
         self.product_manager = ProductManager()
         self.order_manager = OrderManager()
+        # Catalog queries run on one worker thread; only the newest request is applied
+        self.product_loader = TkBackgroundRunner(self.root, max_workers=1, name="product-loader")
+        self._product_query_seq = 0
+        # The filter checkboxes belong to an older category until a rebuild is applied
+        self._filters_dirty = False
+        self._search_after_job = None
+        # Image decode/resize/encode runs on workers; PhotoImages are created and cached on the Tk thread
+        self.image_worker = TkBackgroundRunner(self.root, max_workers=2, name="image-worker")
+        self.preview_cache = PreviewCache()
+        self._preview_seq = {}
         self.table_settings = self._load_table_settings()
         self.table_lookup = {}
         self.table_name_map = {}
@@ -184,7 +199,7 @@ class StoreGUI:
         ).pack(anchor=tk.W, pady=(0, 5))
         
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', lambda *args: self.load_products(update_filters=False))
+        self.search_var.trace('w', lambda *args: self._schedule_product_search())
         search_entry = ttk.Entry(
             search_frame,
             textvariable=self.search_var,
@@ -398,51 +413,44 @@ class StoreGUI:
             anchor='center'
         )
 
+    def _show_preview(self, label, image_path, kind, on_error=None):
+        """Hiển thị ảnh xem trước: lấy từ cache hoặc xử lý ở luồng nền."""
+        # Chỉ áp dụng kết quả của yêu cầu mới nhất cho mỗi label
+        seq = self._preview_seq.get(kind, 0) + 1
+        self._preview_seq[kind] = seq
+        if not image_path or not os.path.exists(image_path):
+            label.configure(image='')
+            return
+        try:
+            key = preview_key(image_path, kind)
+        except OSError as e:
+            label.configure(image='')
+            print(f"Error loading image: {e}")
+            return
+        photo = self.preview_cache.get(key)
+        if photo is not None:
+            label.configure(image=photo)
+            label.image = photo
+            return
+
+        def apply(image, error):
+            if error is not None:
+                if self._preview_seq.get(kind) == seq:
+                    label.configure(image='')
+                print(f"Error loading image: {error}")
+                if on_error:
+                    on_error(error)
+                return
+            photo = ImageTk.PhotoImage(image)
+            self.preview_cache.put(key, photo)
+            if self._preview_seq.get(kind) == seq:
+                label.configure(image=photo)
+                label.image = photo
+
+        self.image_worker.submit(render_preview, apply, image_path, kind)
+
     def show_product_image(self, image_path):
-        if image_path and os.path.exists(image_path):
-            try:
-                # Load image
-                image = Image.open(image_path)
-                
-                # Get original dimensions
-                original_width, original_height = image.size
-                
-                # Target display size
-                display_width = 280
-                display_height = 280
-                
-                # Calculate dimensions maintaining aspect ratio
-                if original_width > original_height:
-                    ratio = display_width / original_width
-                    new_width = display_width
-                    new_height = int(original_height * ratio)
-                else:
-                    ratio = display_height / original_height
-                    new_height = display_height
-                    new_width = int(original_width * ratio)
-                
-                # Resize image
-                resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Create background
-                background = Image.new('RGBA', (display_width, display_height), (255, 255, 255, 0))
-                
-                # Calculate position to center the image
-                x = (display_width - new_width) // 2
-                y = (display_height - new_height) // 2
-                
-                # Paste resized image onto background
-                background.paste(resized_image, (x, y))
-                
-                # Convert to PhotoImage
-                photo = ImageTk.PhotoImage(background)
-                self.image_preview.configure(image=photo)
-                self.image_preview.image = photo
-            except Exception as e:
-                self.image_preview.configure(image='')
-                print(f"Error loading image: {e}")
-        else:
-            self.image_preview.configure(image='')
+        self._show_preview(self.image_preview, image_path, 'detail')
 
     def choose_image(self):
         file_types = [
@@ -456,35 +464,12 @@ class StoreGUI:
 
         if filename:
             self.selected_image_path = filename
-            # Show preview in form
-            try:
-                # Optimize and resize image for storage
-                image = Image.open(filename)
-                
-                # Convert to RGB if necessary
-                if image.mode in ('RGBA', 'P'):
-                    image = image.convert('RGB')
-                
-                # Calculate dimensions for form preview (150x150)
-                preview_size = (150, 150)
-                display_image = image.copy()
-                display_image.thumbnail(preview_size, Image.Resampling.LANCZOS)
-                
-                # Center the preview image
-                background = Image.new('RGB', preview_size, (255, 255, 255))
-                x = (preview_size[0] - display_image.width) // 2
-                y = (preview_size[1] - display_image.height) // 2
-                background.paste(display_image, (x, y))
-                
-                # Show preview
-                photo = ImageTk.PhotoImage(background)
-                self.form_preview.configure(image=photo)
-                self.form_preview.image = photo
-
-                # Also update main preview
-                self.show_product_image(filename)
-            except Exception as e:
-                messagebox.showerror("Lỗi", f"Không thể tải ảnh: {str(e)}")
+            # Show preview in form and main preview
+            self._show_preview(
+                self.form_preview, filename, 'form',
+                on_error=lambda e: messagebox.showerror("Lỗi", f"Không thể tải ảnh: {str(e)}")
+            )
+            self.show_product_image(filename)
 
     def on_select_product(self, event):
         selected = self.tree.selection()
@@ -545,28 +530,24 @@ class StoreGUI:
         """Được gọi khi người dùng thay đổi danh mục."""
         self.load_products(update_filters=True)
 
-    def _update_dynamic_filters(self):
+    def _collect_available_filters(self, category):
+        """Chạy trên luồng nền: lấy các thẻ lọc có sẵn của danh mục."""
+        if category == "all":
+            return []  # Không hiển thị bộ lọc chi tiết cho "Tất cả"
+
+        return self.product_manager.get_filter_options(category)
+
+    def _update_dynamic_filters(self, available_filters):
         """Cập nhật các checkbox lọc chi tiết dựa trên danh mục đã chọn."""
         # Xóa các bộ lọc cũ
         for widget in self.dynamic_filter_frame.winfo_children():
             widget.destroy()
         self.filter_vars.clear()
 
-        category = self.category_var.get()
-        if category == "all":
-            return  # Không hiển thị bộ lọc chi tiết cho "Tất cả"
-
-        # Lấy tất cả sản phẩm của danh mục để tìm các thẻ lọc có sẵn
-        all_category_products = self.product_manager.get_all_products(category)
-        available_filters = set()
-        for p in all_category_products:
-            if 'ai_keys' in p.get('filters', {}):
-                available_filters.update(p['filters']['ai_keys'])
-        
         # Tạo các checkbox mới nếu có
         if available_filters:
             ttk.Label(self.dynamic_filter_frame, text="Lọc Chi Tiết", font=('Helvetica', 10, 'bold')).pack(anchor=tk.W, pady=(0, 5))
-            for f in sorted(list(available_filters)):
+            for f in available_filters:
                 var = tk.BooleanVar(value=False)
                 cb = ttk.Checkbutton(self.dynamic_filter_frame, text=f.capitalize(), variable=var, command=lambda: self.load_products(update_filters=False))
                 cb.pack(anchor=tk.W, padx=10)
@@ -636,21 +617,47 @@ class StoreGUI:
             }
             category = category_map.get(category_display)
 
-            # Save/Update image if selected
-            image_path = None
-            if self.selected_image_path:
-                if not self.selected_image_path.startswith(self.images_dir):
-                    image_path = self.save_uploaded_image(self.selected_image_path)
-                else:
-                    image_path = self.selected_image_path
-
             selected_keys = [k for k, v in self.form_filter_vars.items() if v.get()]
             attributes = {'ai_keys': selected_keys} if selected_keys else None
+            fields = dict(name=name, price=price, category=category, quantity=quantity,
+                          description=description, attributes=attributes,
+                          product_id=self.current_product_id if self.editing_mode else None)
+
+            # Save/Update image if selected; a new upload is encoded on the image worker
+            if self.selected_image_path and not self.selected_image_path.startswith(self.images_dir):
+                self.submit_btn.configure(state=tk.DISABLED)
+                self.image_worker.submit(
+                    self.save_uploaded_image,
+                    lambda image_path, error: self._on_image_uploaded(fields, image_path, error),
+                    self.selected_image_path
+                )
+                return
+            self._save_product(fields, self.selected_image_path or None)
+
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Đã xảy ra lỗi: {str(e)}")
 
-            if self.editing_mode:
+    def _on_image_uploaded(self, fields, image_path, error):
+        self.submit_btn.configure(state=tk.NORMAL)
+        if error is not None:
+            messagebox.showerror("Lỗi", f"Không thể lưu ảnh: {str(error)}")
+            print(f"Error saving image: {error}")
+            image_path = None
+        self._save_product(fields, image_path)
+
+    def _save_product(self, fields, image_path):
+        try:
+            name = fields['name']
+            price = fields['price']
+            category = fields['category']
+            quantity = fields['quantity']
+            description = fields['description']
+            attributes = fields['attributes']
+
+            if fields['product_id'] is not None:
                 # Update existing product
                 success = self.product_manager.update_product(
-                    self.current_product_id,
+                    fields['product_id'],
                     name=name,
                     price=price,
                     category=category,
@@ -690,36 +697,38 @@ class StoreGUI:
             messagebox.showerror("Lỗi", f"Đã xảy ra lỗi: {str(e)}")
 
     def save_uploaded_image(self, source_path):
+        """Chạy trên luồng xử lý ảnh: tối ưu ảnh tải lên và trả về đường dẫn đã lưu."""
         if not source_path:
             return None
 
-        try:
-            # Open and optimize image
-            image = Image.open(source_path)
-            
+        # Open and optimize image
+        with Image.open(source_path) as image:
+            # Decode large JPEGs at a reduced scale before the final resize
+            image.draft('RGB', (800, 800))
+
             # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'P'):
+            if image.mode != 'RGB':
                 image = image.convert('RGB')
-            
+
             # Calculate optimal dimensions while maintaining aspect ratio
             max_size = (800, 800)  # Maximum dimensions
             image.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
+
             # Create a unique filename using timestamp
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"product_{timestamp}.jpg"  # Always save as JPG
             destination = os.path.join(self.images_dir, filename)
-            
+
             # Save optimized image with good quality but reduced file size
             image.save(destination, 'JPEG', quality=85, optimize=True)
-            
-            print(f"Image saved successfully: {destination}")
-            return destination
 
+        print(f"Image saved successfully: {destination}")
+        # Tạo sẵn ảnh thu nhỏ/WebP để /images?w=&fmt= không phải xử lý khi có request đầu tiên
+        try:
+            image_variants.generate_variants(destination)
         except Exception as e:
-            messagebox.showerror("Lỗi", f"Không thể lưu ảnh: {str(e)}")
-            print(f"Error saving image: {e}")
-            return None
+            print(f"Warning: Could not pre-generate image variants: {e}")
+        return destination
 
     def clear_form(self):
         # Clear all form fields
@@ -730,41 +739,84 @@ class StoreGUI:
         self.form_preview.configure(image='')
         self.image_preview.configure(image='')
 
+    def _schedule_product_search(self):
+        """Chờ người dùng ngừng gõ rồi mới tìm kiếm."""
+        if self._search_after_job is not None:
+            self.root.after_cancel(self._search_after_job)
+        self._search_after_job = self.root.after(PRODUCT_SEARCH_DEBOUNCE_MS, self._run_scheduled_search)
+
+    def _run_scheduled_search(self):
+        self._search_after_job = None
+        self.load_products(update_filters=False)
+
     def load_products(self, update_filters=True):
         """
         Tải và hiển thị sản phẩm, có tùy chọn cập nhật bộ lọc chi tiết.
+        Truy vấn chạy trên luồng nền; kết quả cũ hơn yêu cầu mới nhất bị bỏ qua.
         :param update_filters: True nếu cần tạo lại các checkbox lọc (khi đổi danh mục).
         """
+        category = self.category_var.get()
+        search = self.search_var.get()
+        # Yêu cầu mới hơn sẽ bỏ kết quả của lần tạo lại bộ lọc đang chờ,
+        # nên phải tự tạo lại bộ lọc cho tới khi có kết quả được áp dụng
         if update_filters:
-            self._update_dynamic_filters()
+            self._filters_dirty = True
+        update_filters = self._filters_dirty
+        # Khi tạo lại bộ lọc, các checkbox cũ sẽ bị xóa nên không áp dụng nữa
+        active_filters = set() if update_filters else {key for key, var in self.filter_vars.items() if var.get()}
+
+        self._product_query_seq += 1
+        seq = self._product_query_seq
+        self.product_loader.submit(
+            self._query_products,
+            lambda result, error: self._apply_products(seq, update_filters, result, error),
+            seq, category, search, active_filters, update_filters
+        )
 
-        # Clear current items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def _query_products(self, seq, category, search, active_filters, update_filters):
+        """Chạy trên luồng nền: không được đụng tới widget Tk."""
+        if seq != self._product_query_seq:
+            return None  # Đã có yêu cầu mới hơn
+        try:
+            available_filters = self._collect_available_filters(category) if update_filters else None
 
-        # Lấy sản phẩm dựa trên danh mục và tìm kiếm
-        category = self.category_var.get()
-        search = self.search_var.get()
+            # Lấy sản phẩm dựa trên danh mục và tìm kiếm
+            if search:
+                products = self.product_manager.search_catalog(
+                    search,
+                    category=None if category == "all" else category
+                )
+            elif category != "all":
+                products = self.product_manager.get_all_products(category)
+            else:
+                products = self.product_manager.get_all_products()
 
-        if search:
-            products = self.product_manager.search_products(search)
-            # Nếu đang tìm kiếm, có thể lọc thêm theo danh mục hiện tại
-            if category != "all":
-                products = [p for p in products if p['category'] == category]
-        elif category != "all":
-            products = self.product_manager.get_all_products(category)
-        else:
-            products = self.product_manager.get_all_products()
-
-        # Lọc sản phẩm dựa trên các checkbox đã chọn
-        active_filters = {key for key, var in self.filter_vars.items() if var.get()}
-        if active_filters:
-            filtered_products = []
-            for product in products:
-                product_tags = set(product.get('filters', {}).get('ai_keys', []))
-                if active_filters.issubset(product_tags):
-                    filtered_products.append(product)
-            products = filtered_products
+            # Lọc sản phẩm dựa trên các checkbox đã chọn (tra chỉ mục thẻ lọc)
+            if active_filters:
+                matching_ids = self.product_manager.get_product_ids_with_ai_keys(
+                    active_filters,
+                    category=None if category == "all" else category
+                )
+                products = [product for product in products if product['id'] in matching_ids]
+            return products, available_filters
+        finally:
+            # Trả kết nối của luồng nền về pool
+            self.product_manager.db.release()
+
+    def _apply_products(self, seq, update_filters, result, error):
+        if seq != self._product_query_seq or (result is None and error is None):
+            return
+        if error is not None:
+            print(f"Error loading products: {error}")
+            messagebox.showerror("Lỗi", f"Không thể tải sản phẩm: {error}")
+            return
+        products, available_filters = result
+        if update_filters:
+            self._update_dynamic_filters(available_filters)
+            self._filters_dirty = False
+
+        # Clear current items
+        self.tree.delete(*self.tree.get_children())
 
         # Category display mapping
         category_display = {
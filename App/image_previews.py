@@ -0,0 +1,63 @@
+"""Off-thread preview rendering and an LRU of Tk images for StoreGUI.
+
+``render_preview`` only uses Pillow and is safe on a worker thread; turning
+its result into an ``ImageTk.PhotoImage`` must happen on the Tk thread, which
+is also the only thread that touches ``PreviewCache``.
+"""
+import os
+from collections import OrderedDict
+from PIL import Image
+
+# kind -> (box size, background mode, background color, upscale small images)
+PREVIEW_KINDS = {
+    'detail': ((280, 280), 'RGBA', (255, 255, 255, 0), True),
+    'form': ((150, 150), 'RGB', (255, 255, 255), False),
+}
+DEFAULT_PREVIEW_CACHE_SIZE = 64
+
+
+def preview_key(path, kind):
+    """Cache key that changes whenever the file is replaced or rewritten."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, kind)
+
+
+def render_preview(path, kind):
+    """Decode ``path`` and center it on a background of the preview size (worker thread)."""
+    (width, height), mode, color, upscale = PREVIEW_KINDS[kind]
+    with Image.open(path) as image:
+        # Let JPEG decode at a reduced scale instead of full resolution
+        image.draft('RGB', (width, height))
+        image = image.convert('RGBA' if mode == 'RGBA' else 'RGB')
+        if upscale:
+            ratio = min(width / image.width, height / image.height)
+            size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+            image = image.resize(size, Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+    background = Image.new(mode, (width, height), color)
+    background.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+    return background
+
+
+class PreviewCache:
+    """LRU of PhotoImage previews keyed by path, mtime, size and preview kind."""
+
+    def __init__(self, capacity=DEFAULT_PREVIEW_CACHE_SIZE):
+        self.capacity = capacity
+        self._items = OrderedDict()
+
+    def get(self, key):
+        photo = self._items.get(key)
+        if photo is not None:
+            self._items.move_to_end(key)
+        return photo
+
+    def put(self, key, photo):
+        self._items[key] = photo
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
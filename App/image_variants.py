@@ -0,0 +1,121 @@
+"""Resized / re-encoded product image variants cached on disk.
+
+A variant of ``images/cake.jpg`` lives in ``images/_variants/`` under a name
+built from the source content hash, width and format
+(``cake-<sha1[:16]>-w320.webp``), so replacing the source never serves a
+stale variant and generated files never need invalidating. Variants are made
+at upload time (StoreGUI) or lazily on the first request (api.py).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+try:
+    from PIL import Image, features
+except ImportError:  # optional: without Pillow /images serves originals only
+    Image = None
+    features = None
+
+VARIANTS_DIRNAME = '_variants'
+VARIANT_WIDTHS = (160, 320, 640, 1024)
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+}
+FORMAT_ALIASES = {'jpg': 'jpeg', 'jpeg': 'jpeg', 'webp': 'webp'}
+UPLOAD_FORMATS = ('jpeg', 'webp')
+
+_digest_lock = threading.Lock()
+_digests = {}
+
+
+def available():
+    return Image is not None
+
+
+def webp_supported():
+    return Image is not None and features.check('webp')
+
+
+def normalize_format(fmt):
+    """Map a requested format name to a key of VARIANT_FORMATS (ValueError if unknown)."""
+    key = FORMAT_ALIASES.get((fmt or '').strip().lower())
+    if key is None or (key == 'webp' and not webp_supported()):
+        raise ValueError(f"unsupported image format: {fmt}")
+    return key
+
+
+def snap_width(width):
+    """Smallest configured width >= ``width`` so arbitrary sizes cannot flood the cache."""
+    if width <= 0:
+        raise ValueError(f"invalid width: {width}")
+    for candidate in VARIANT_WIDTHS:
+        if candidate >= width:
+            return candidate
+    return VARIANT_WIDTHS[-1]
+
+
+def content_digest(path):
+    """sha1 of the file content, memoized per (path, mtime, size)."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        cached = _digests.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(65536), b''):
+            sha1.update(block)
+    digest = sha1.hexdigest()
+    with _digest_lock:
+        _digests[path] = (signature, digest)
+    return digest
+
+
+def variant_path(source_path, width, fmt):
+    """Return (path, digest, mimetype) of the variant, generating it if missing."""
+    pil_format, extension, mimetype, save_options = VARIANT_FORMATS[fmt]
+    digest = content_digest(source_path)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    variants_dir = os.path.join(os.path.dirname(source_path), VARIANTS_DIRNAME)
+    target = os.path.join(variants_dir, f"{stem}-{digest[:16]}-w{width}.{extension}")
+    if not os.path.exists(target):
+        _render(source_path, target, width, pil_format, save_options)
+    return target, f"{digest[:16]}-w{width}-{fmt}", mimetype
+
+
+def _render(source_path, target, width, pil_format, save_options):
+    if Image is None:
+        raise RuntimeError("Pillow is required to generate image variants")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(source_path) as image:
+        image.draft('RGB', (width, width))
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode == 'P':
+            image = image.convert('RGBA')
+        # thumbnail() never upscales; height is bounded by the same width
+        image.thumbnail((width, width), Image.Resampling.LANCZOS)
+        # Write to a temp file first so concurrent requests never read a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                image.save(handle, pil_format, **save_options)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def generate_variants(source_path, widths=VARIANT_WIDTHS, formats=UPLOAD_FORMATS):
+    """Pre-generate every width/format variant of an uploaded image; returns their paths."""
+    paths = []
+    for fmt in formats:
+        if fmt == 'webp' and not webp_supported():
+            continue
+        for width in widths:
+            paths.append(variant_path(source_path, width, fmt)[0])
+    return paths
@@ -147,6 +147,8 @@ class KitchenApp(tk.Tk):
         self._refresh_in_progress = False
         self._pending_refresh = False
         self._known_order_ids = set()
+        self._orders_cache = {}
+        self._orders_version = None
         self.last_refresh_var = tk.StringVar(value="Chưa cập nhật")
 
         self._build_layout()
@@ -278,7 +280,30 @@ class KitchenApp(tk.Tk):
         self._update_action_buttons()
 
     # --- Data flow ------------------------------------------------------
-    def refresh_orders(self, keep_selection=None):
+    def _sync_orders(self):
+        """Apply the order changes feed to the local cache; return True when it changed."""
+        changes = self.order_manager.get_orders_changed_since(self._orders_version, KITCHEN_RELEVANT_STATUSES)
+        if changes is None:
+            raise RuntimeError("Không thể tải thay đổi đơn hàng")
+        changed = changes["reset"] or bool(changes["deleted"])
+        if changes["reset"]:
+            self._orders_cache = {}
+        for order_id in changes["deleted"]:
+            self._orders_cache.pop(order_id, None)
+        for order in changes["orders"]:
+            order_id = order["id"]
+            previous = self._orders_cache.get(order_id)
+            if order.get("status") in KITCHEN_RELEVANT_STATUSES:
+                if previous != order:
+                    self._orders_cache[order_id] = order
+                    changed = True
+            elif previous is not None:
+                del self._orders_cache[order_id]
+                changed = True
+        self._orders_version = changes["version"]
+        return changed
+
+    def refresh_orders(self, keep_selection=None, only_if_changed=False):
         if self._refresh_in_progress:
             self._pending_refresh = True
             return
@@ -295,14 +320,20 @@ class KitchenApp(tk.Tk):
         status_filter = next((values for label, values in FILTER_OPTIONS if label == filter_label), [])
 
         try:
-            if status_filter:
-                orders = self.order_manager.get_all_orders(status_filter)
-            else:
-                orders = self.order_manager.get_all_orders(KITCHEN_RELEVANT_STATUSES)
+            changed = self._sync_orders()
+            visible_statuses = set(status_filter or KITCHEN_RELEVANT_STATUSES)
+            orders = sorted(
+                (order for order in self._orders_cache.values() if order.get("status") in visible_statuses),
+                key=lambda order: order["id"],
+                reverse=True
+            )
         except Exception as exc:  # pylint: disable=broad-except
             self.last_refresh_var.set(f"Lỗi cập nhật lúc {refresh_stamp}")
             messagebox.showerror("Loi", f"Không thể tải danh sách đơn hàng:\n{exc}")
         else:
+            if only_if_changed and not changed:
+                self.last_refresh_var.set(f"Cap nhat luc {refresh_stamp}")
+                return
             previous_ids = set(self._known_order_ids)
             current_ids = {order["id"] for order in orders}
             new_ids = current_ids - previous_ids if previous_ids else set()
@@ -547,7 +578,7 @@ class KitchenApp(tk.Tk):
 
     def _auto_refresh_callback(self):
         keep_id = self.selected_order["id"] if self.selected_order else None
-        self.refresh_orders(keep_selection=keep_id)
+        self.refresh_orders(keep_selection=keep_id, only_if_changed=True)
 
     def _clear_new_order_tags(self, order_ids):
         if not self.orders_tree:
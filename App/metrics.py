@@ -0,0 +1,258 @@
+"""In-process counters and histograms exposed in Prometheus text format.
+
+Recording is a dict lookup plus a short critical section, so it is cheap
+enough for every request and every query. Values are per process: with a
+multi-worker server each worker reports its own series.
+"""
+import bisect
+import re
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Request/query latency buckets in seconds (5 ms .. 10 s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Statements per request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_LABEL_ESCAPES = str.maketrans({'\\': r'\\', '"': r'\"', '\n': r'\n'})
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{str(value).translate(_LABEL_ESCAPES)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labelvalues -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                yield self.name + '_bucket', _format_labels(self.labelnames, labelvalues, le), cumulative
+            yield self.name + '_sum', _format_labels(self.labelnames, labelvalues), round(series[-1], 6)
+            yield self.name + '_count', _format_labels(self.labelnames, labelvalues), cumulative
+
+
+class Collector:
+    """Values read at scrape time from ``collect()`` -> [(labelvalues, value)].
+
+    Used for state owned elsewhere (pool, caches); ``kind`` is "gauge", or
+    "counter" for monotonic totals kept by that code.
+    """
+
+    def __init__(self, name, documentation, labelnames, collect, kind='gauge'):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def reset(self):
+        pass
+
+    def samples(self):
+        try:
+            values = list(self.collect())
+        except Exception as e:
+            print(f"Metrics collector {self.name} failed: {e}")
+            return
+        for labelvalues, value in values:
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, name, documentation, labelnames, collect, kind='gauge'):
+        return self.register(Collector(name, documentation, labelnames, collect, kind))
+
+    def reset(self):
+        """Drop recorded values, e.g. those inherited by a forked worker."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def render(self):
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'web_store_http_requests_total', 'HTTP requests by route, method and status',
+    ('route', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'web_store_http_request_duration_seconds', 'HTTP request latency by route',
+    ('route', 'method'))
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    'web_store_db_query_duration_seconds', 'Database round-trip time by query label (statement and table)',
+    ('query',), buckets=DB_BUCKETS)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    'web_store_db_query_errors_total', 'Database statements that raised, by query label', ('query',))
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    'web_store_db_queries_per_request', 'Database statements run by one HTTP request, by route',
+    ('route',), buckets=QUERY_COUNT_BUCKETS)
+ORDER_CREATE = REGISTRY.counter(
+    'web_store_order_create_total', 'POST /orders requests by outcome (ok, validation, error or OrderManager.last_error_code)', ('outcome',))
+
+
+_QUERY_LABEL_RE = re.compile(
+    r"^\s*(?:/\*.*?\*/\s*)*(select|insert|update|delete|replace|show|describe|alter|create)\b"
+    r"(?:.*?\b(?:from|into|update|table)\s+(?:if\s+(?:not\s+)?exists\s+)?`?(\w+))?",
+    re.IGNORECASE | re.DOTALL
+)
+_MAX_LABEL_CACHE = 2048
+_labels = {}
+
+
+def query_label(sql):
+    """Low-cardinality label such as "select products" for a SQL statement."""
+    label = _labels.get(sql)
+    if label is None:
+        match = _QUERY_LABEL_RE.match(sql if isinstance(sql, str) else str(sql))
+        if match:
+            verb = match.group(1).lower()
+            table = match.group(2) or ''
+            if verb == 'update' and not table:
+                table = sql.split()[1].strip('`') if len(sql.split()) > 1 else ''
+            label = f"{verb} {table.lower()}".strip()
+        else:
+            label = 'other'
+        if len(_labels) < _MAX_LABEL_CACHE:
+            _labels[sql] = label
+    return label
+
+
+def observe_query(sql, seconds, error=None):
+    """Query observer for Database: records round trips and time per query label."""
+    label = query_label(sql)
+    DB_QUERY_LATENCY.observe(seconds, label)
+    if error is not None:
+        DB_QUERY_ERRORS.inc(label)
+
+
+def register_service_collectors(db, catalog_cache, qr_service):
+    """Expose connection pool and cache state of one process's services."""
+    def pool_connections():
+        stats = db.pool_stats()
+        return [((state,), stats.get(state, 0)) for state in ('open', 'idle', 'checked_out')]
+
+    def pool_capacity():
+        stats = db.pool_stats()
+        return [((), stats.get('size', 0) + stats.get('max_overflow', 0))] if stats else []
+
+    def pool_events():
+        stats = db.pool_stats()
+        return [((event,), stats.get(event, 0)) for event in ('checkouts', 'waits', 'timeouts', 'created', 'discarded')]
+
+    def cache_lookups():
+        catalog = catalog_cache.stats()
+        qr = qr_service.stats()
+        return [
+            (('catalog', 'hit'), catalog['hits']),
+            (('catalog', 'miss'), catalog['misses']),
+            (('qr', 'hit'), qr['memory_hits'] + qr['disk_hits']),
+            (('qr', 'miss'), qr['renders']),
+        ]
+
+    def cache_hit_ratio():
+        ratios = {}
+        for (cache, result), value in cache_lookups():
+            hits, total = ratios.get(cache, (0, 0))
+            ratios[cache] = (hits + (value if result == 'hit' else 0), total + value)
+        return [((cache,), round(hits / total, 4) if total else 0.0) for cache, (hits, total) in sorted(ratios.items())]
+
+    REGISTRY.collector('web_store_db_pool_connections', 'Pooled MySQL connections by state',
+                       ('state',), pool_connections)
+    REGISTRY.collector('web_store_db_pool_capacity', 'Pool size plus allowed overflow', (), pool_capacity)
+    REGISTRY.collector('web_store_db_pool_events_total', 'Connection pool checkouts, waits, timeouts and churn',
+                       ('event',), pool_events, kind='counter')
+    REGISTRY.collector('web_store_cache_lookups_total', 'Cache lookups by cache and result',
+                       ('cache', 'result'), cache_lookups, kind='counter')
+    REGISTRY.collector('web_store_cache_hit_ratio', 'Cache hit ratio since process start',
+                       ('cache',), cache_hit_ratio)
@@ -0,0 +1,597 @@
+"""Versioned, run-once schema migrations for the web_store database.
+
+Each migration is registered with an increasing version number and recorded
+in ``schema_version`` once applied. On a migrated database startup costs a
+single primary-key lookup; pending migrations run under a MySQL advisory lock
+so parallel processes never apply them twice. Manual migrations (destructive
+clean-ups that older processes would trip over) are never applied at
+startup: automatic migrations stop in front of them until an operator runs
+``python migrations.py --apply-manual``.
+"""
+import json
+import threading
+import time
+from pathlib import Path
+from mysql.connector import Error, errorcode
+from text_utils import table_lookup_key, parse_ai_keys
+
+SCHEMA_LOCK_NAME = 'web_store_schema_migrations'
+SCHEMA_LOCK_TIMEOUT = 60
+TAGS_BACKFILL_CHUNK = 500
+
+MIGRATIONS = []
+MANUAL_MIGRATIONS = set()
+
+_checked_lock = threading.Lock()
+_checked_databases = set()
+
+
+def migration(version, description, manual=False):
+    """Register ``func(cursor, conn)`` as schema migration ``version``."""
+    def register(func):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, description, func))
+        if manual:
+            MANUAL_MIGRATIONS.add(version)
+        return func
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def _pending(current, include_manual=False):
+    """Migrations after ``current`` to apply now, stopping at an unapplied manual one."""
+    pending = []
+    for version, description, func in MIGRATIONS:
+        if version <= current:
+            continue
+        if version in MANUAL_MIGRATIONS and not include_manual:
+            break
+        pending.append((version, description, func))
+    return pending
+
+
+def load_table_seed_entries():
+    config_path = Path(__file__).resolve().parent / "config" / "tables.json"
+    try:
+        with open(config_path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        tables = data.get("tables", [])
+        result = []
+        for entry in tables:
+            number = entry.get("number") or entry.get("id")
+            name = entry.get("name")
+            if number is None:
+                continue
+            number_text = str(number).strip()
+            if not number_text:
+                continue
+            if not name:
+                name = f"Ban {number_text}"
+            result.append({"number": number_text, "name": name})
+        return result
+    except FileNotFoundError:
+        return []
+    except Exception as exc:
+        print(f"Warning: Could not load table configuration: {exc}")
+        return []
+
+
+def seed_dining_tables(cursor, conn):
+    try:
+        cursor.execute("SELECT COUNT(*) FROM dining_tables")
+        current = cursor.fetchone()
+        current_count = current[0] if current else 0
+        if current_count and current_count > 0:
+            return
+        seed_entries = load_table_seed_entries()
+        if not seed_entries:
+            seed_entries = [{"number": str(i), "name": f"Ban {i}"} for i in range(1, 13)]
+        cursor.execute("SHOW COLUMNS FROM dining_tables LIKE 'number_key'")
+        if cursor.fetchall():
+            insert_sql = (
+                "INSERT INTO dining_tables (table_number, display_name, number_key, display_key) "
+                "VALUES (%s, %s, %s, %s)"
+            )
+            values = [
+                (entry["number"], entry["name"], table_lookup_key(entry["number"]), table_lookup_key(entry["name"]))
+                for entry in seed_entries
+            ]
+        else:
+            # Before migration 3; it derives the keys of these rows
+            insert_sql = "INSERT INTO dining_tables (table_number, display_name) VALUES (%s, %s)"
+            values = [(entry["number"], entry["name"]) for entry in seed_entries]
+        cursor.executemany(insert_sql, values)
+        conn.commit()
+        print(f"Seeded {len(values)} dining tables from configuration")
+    except Error as exc:
+        print(f"Warning: Could not seed dining tables: {exc}")
+
+
+
+def refresh_dining_table_keys(cursor, conn):
+    """Store table_lookup_key() of table_number/display_name for indexed lookups.
+
+    Only rows whose keys are missing or stale (inserted or renamed outside
+    the app) are written. Returns the number of rows fixed.
+    """
+    cursor.execute("SELECT id, table_number, display_name, number_key, display_key FROM dining_tables")
+    values = []
+    for table_id, number, name, number_key, display_key in cursor.fetchall():
+        keys = (table_lookup_key(number), table_lookup_key(name))
+        if keys != (number_key, display_key):
+            values.append(keys + (table_id,))
+    if values:
+        cursor.executemany(
+            "UPDATE dining_tables SET number_key = %s, display_key = %s WHERE id = %s",
+            values
+        )
+        conn.commit()
+    return len(values)
+
+def _print_backfill_progress(done, total):
+    print(f"Backfilling product_tags: {done}/{total} tags copied")
+
+
+def _legacy_tag_pairs(cursor, chunk_size):
+    """(product_id, tag) pairs an older process would show, or None once products.ai_keys is gone."""
+    cursor.execute("SHOW COLUMNS FROM products LIKE 'ai_keys'")
+    if not cursor.fetchall():
+        return None
+    pairs = set()
+    cursor.execute(
+        "SELECT product_id, attribute_value FROM product_attributes WHERE attribute_type = %s",
+        ('ai_keys',)
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for product_id, value in rows:
+            tag = str(value).strip() if value is not None else ''
+            if tag:
+                pairs.add((product_id, tag))
+
+    cursor.execute("SELECT id, ai_keys FROM products WHERE ai_keys IS NOT NULL")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for product_id, raw in rows:
+            for tag in parse_ai_keys(raw):
+                pairs.add((product_id, tag))
+    return pairs
+
+
+def _write_tag_pairs(cursor, conn, statement, pairs, chunk_size, progress):
+    """Run ``statement`` (with a {pairs} slot) over ``pairs`` chunk by chunk."""
+    pending = sorted(pairs)
+    total = len(pending)
+    for start in range(0, total, chunk_size):
+        chunk = pending[start:start + chunk_size]
+        cursor.execute(
+            statement.format(pairs=", ".join(["(%s, %s)"] * len(chunk))),
+            tuple(value for pair in chunk for value in pair)
+        )
+        conn.commit()
+        if progress:
+            progress(min(start + chunk_size, total), total)
+    return total
+
+
+def backfill_product_tags(cursor, conn, chunk_size=TAGS_BACKFILL_CHUNK, progress=_print_backfill_progress):
+    """Copy legacy ai_keys into product_tags.
+
+    Sources are ``ai_keys`` rows of product_attributes, one tag per row and
+    copied verbatim (a value like "bánh, ngọt" stays one tag), and the JSON
+    ``products.ai_keys`` column. Tags are written with multi-row
+    ``INSERT IGNORE`` per chunk, so re-running is harmless. Returns the
+    number of (product, tag) pairs seen (0 once the legacy column is gone).
+    """
+    pairs = _legacy_tag_pairs(cursor, chunk_size)
+    if not pairs:
+        return 0
+    return _write_tag_pairs(
+        cursor, conn, "INSERT IGNORE INTO product_tags (product_id, tag) VALUES {pairs}",
+        pairs, chunk_size, progress
+    )
+
+
+def resync_product_tags(cursor, conn, chunk_size=TAGS_BACKFILL_CHUNK, progress=_print_backfill_progress):
+    """Make product_tags equal to the legacy ai_keys copies; return (added, removed).
+
+    Older processes write both legacy copies and newer ones keep
+    ``products.ai_keys`` in step with product_tags (and drop the attribute
+    rows on update), so the legacy copies hold every product's latest tags
+    whichever version wrote them. Tags missing there are removed, which a
+    plain backfill cannot do. No-op once ``products.ai_keys`` is gone.
+    """
+    legacy = _legacy_tag_pairs(cursor, chunk_size)
+    if legacy is None:
+        return 0, 0
+    current = set()
+    cursor.execute("SELECT product_id, tag FROM product_tags")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        current.update((product_id, tag) for product_id, tag in rows)
+    added = _write_tag_pairs(
+        cursor, conn, "INSERT IGNORE INTO product_tags (product_id, tag) VALUES {pairs}",
+        legacy - current, chunk_size, progress
+    )
+    removed = _write_tag_pairs(
+        cursor, conn, "DELETE FROM product_tags WHERE (product_id, tag) IN ({pairs})",
+        current - legacy, chunk_size, None
+    )
+    return added, removed
+
+
+@migration(1, "Baseline schema (products, attributes, orders, tables, items, users)")
+def baseline_schema(cursor, conn):
+    # Create products table with quantity field
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            category ENUM('cake', 'food', 'drink') NOT NULL,
+            description TEXT,
+            image_url VARCHAR(255),
+            quantity INT DEFAULT 0,
+            is_available BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Ensure optional columns exist on products
+    try:
+        cursor.execute("DESCRIBE products")
+        product_columns = {row[0] for row in cursor.fetchall()}
+        if 'ai_keys' not in product_columns:
+            # Store as TEXT (JSON-encoded array)
+            cursor.execute("ALTER TABLE products ADD COLUMN ai_keys TEXT NULL")
+            conn.commit()
+            print("Added column 'ai_keys' to products table")
+    except Error as e:
+        print(f"Warning: Could not verify/alter products table for ai_keys column: {e}")
+
+    # Create product_attributes table for filters
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_attributes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT,
+            attribute_type VARCHAR(50),
+            attribute_value VARCHAR(255),
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Create orders table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INT PRIMARY KEY,
+            customer_name VARCHAR(255) NOT NULL,
+            total_price DECIMAL(10, 2) NOT NULL,
+            status ENUM('pending', 'confirmed', 'sent_to_kitchen', 'processing', 'completed', 'cancelled', 'served') DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Ensure extended order columns exist
+    try:
+        cursor.execute("DESCRIBE orders")
+        order_columns = {row[0] for row in cursor.fetchall()}
+        alter_stmts = []
+        desired_statuses = (
+            "pending",
+            "confirmed",
+            "sent_to_kitchen",
+            "processing",
+            "completed",
+            "cancelled",
+            "served"
+        )
+        cursor.execute("SHOW COLUMNS FROM orders LIKE 'status'")
+        status_column = cursor.fetchone()
+        if status_column:
+            column_type = status_column[1].lower()
+            if not all(status in column_type for status in desired_statuses):
+                enum_values = ", ".join(f"'{status}'" for status in desired_statuses)
+                cursor.execute(
+                    f"ALTER TABLE orders MODIFY status ENUM({enum_values}) DEFAULT 'pending'"
+                )
+                conn.commit()
+        if 'order_type' not in order_columns:
+            alter_stmts.append("ADD COLUMN order_type VARCHAR(20) NULL")
+        if 'payment_method' not in order_columns:
+            alter_stmts.append("ADD COLUMN payment_method VARCHAR(20) NULL")
+        if 'table_number' not in order_columns:
+            alter_stmts.append("ADD COLUMN table_number VARCHAR(50) NULL")
+        if 'needs_assistance' not in order_columns:
+            alter_stmts.append("ADD COLUMN needs_assistance BOOLEAN DEFAULT FALSE")
+        if 'note' not in order_columns:
+            alter_stmts.append("ADD COLUMN note TEXT NULL")
+        if 'customer_email' not in order_columns:
+            alter_stmts.append("ADD COLUMN customer_email VARCHAR(255) NULL")
+        if 'email_receipt' not in order_columns:
+            alter_stmts.append("ADD COLUMN email_receipt BOOLEAN DEFAULT FALSE")
+        if 'payment_status' not in order_columns:
+            alter_stmts.append("ADD COLUMN payment_status ENUM('unpaid','paid') DEFAULT 'unpaid'")
+        if 'qr_code_data' not in order_columns:
+            alter_stmts.append("ADD COLUMN qr_code_data TEXT NULL")
+        if alter_stmts:
+            stmt = "ALTER TABLE orders " + ", ".join(alter_stmts)
+            cursor.execute(stmt)
+            conn.commit()
+    except Error as e:
+        print(f"Warning: Could not alter orders table: {e}")
+
+    # Create dining tables table and seed data if needed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dining_tables (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            table_number VARCHAR(50) NOT NULL UNIQUE,
+            display_name VARCHAR(100) NOT NULL,
+            is_occupied BOOLEAN NOT NULL DEFAULT FALSE,
+            current_order_id INT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            CONSTRAINT fk_dining_tables_order
+                FOREIGN KEY (current_order_id) REFERENCES orders(id)
+                ON DELETE SET NULL
+        )
+    ''')
+    seed_dining_tables(cursor, conn)
+
+    # Create order_items table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT,
+            product_id INT,
+            quantity INT,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Ensure selected options column exists for order_items
+    try:
+        cursor.execute("DESCRIBE order_items")
+        item_columns = {row[0] for row in cursor.fetchall()}
+        if 'selected_options' not in item_columns:
+            cursor.execute("ALTER TABLE order_items ADD COLUMN selected_options TEXT NULL")
+            conn.commit()
+    except Error as e:
+        print(f"Warning: Could not alter order_items table: {e}")
+
+    # Check if users table exists and has correct structure
+    cursor.execute("SHOW TABLES LIKE 'users'")
+    if cursor.fetchone():
+        cursor.execute("DESCRIBE users")
+        columns = [row[0] for row in cursor.fetchall()]
+        if 'name' not in columns or 'email' not in columns or 'password_hash' not in columns:
+            print("Dropping users table due to missing required columns")
+            cursor.execute("DROP TABLE users")
+            conn.commit()
+
+    # Create users table for authentication
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL UNIQUE,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Verify table structure
+    cursor.execute("DESCRIBE users")
+    columns = [row[0] for row in cursor.fetchall()]
+    print("Users table columns:", columns)
+
+
+
+@migration(2, "AUTO_INCREMENT ids for products and orders")
+def auto_increment_ids(cursor, conn):
+    # Existing ids are kept; InnoDB continues the counter from MAX(id) + 1.
+    # Foreign keys from product_attributes, order_items and dining_tables
+    # reference these columns, so the checks are paused for the MODIFY.
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    try:
+        cursor.execute("ALTER TABLE products MODIFY id INT NOT NULL AUTO_INCREMENT")
+        cursor.execute("ALTER TABLE orders MODIFY id INT NOT NULL AUTO_INCREMENT")
+    finally:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+@migration(3, "Indexed lookup keys on dining_tables")
+def dining_table_lookup_keys(cursor, conn):
+    cursor.execute("SHOW COLUMNS FROM dining_tables LIKE 'number_key'")
+    if not cursor.fetchall():
+        cursor.execute(
+            "ALTER TABLE dining_tables "
+            "ADD COLUMN number_key VARCHAR(50) NULL, "
+            "ADD COLUMN display_key VARCHAR(100) NULL, "
+            "ADD INDEX idx_dining_tables_number_key (number_key), "
+            "ADD INDEX idx_dining_tables_display_key (display_key)"
+        )
+    refresh_dining_table_keys(cursor, conn)
+
+
+@migration(4, "Indexes for keyset pagination of orders")
+def order_listing_indexes(cursor, conn):
+    cursor.execute("SHOW INDEX FROM orders")
+    existing = {row[2] for row in cursor.fetchall()}
+    additions = []
+    if 'idx_orders_status_id' not in existing:
+        additions.append("ADD INDEX idx_orders_status_id (status, id)")
+    if 'idx_orders_created_at' not in existing:
+        additions.append("ADD INDEX idx_orders_created_at (created_at)")
+    if additions:
+        cursor.execute("ALTER TABLE orders " + ", ".join(additions))
+
+
+@migration(5, "orders.updated_at and order_deletions for the changes feed")
+def order_change_tracking(cursor, conn):
+    cursor.execute("SHOW COLUMNS FROM orders LIKE 'updated_at'")
+    if not cursor.fetchall():
+        cursor.execute(
+            "ALTER TABLE orders "
+            "ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6), "
+            "ADD INDEX idx_orders_updated_at (updated_at)"
+        )
+        cursor.execute("UPDATE orders SET updated_at = COALESCE(created_at, updated_at)")
+        conn.commit()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_deletions (
+            order_id INT PRIMARY KEY,
+            deleted_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            INDEX idx_order_deletions_deleted_at (deleted_at)
+        )
+    ''')
+
+
+
+@migration(6, "product_tags table replacing JSON products.ai_keys; product_attributes index")
+def normalized_product_tags(cursor, conn):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_tags (
+            product_id INT NOT NULL,
+            tag VARCHAR(255) NOT NULL,
+            PRIMARY KEY (product_id, tag),
+            INDEX idx_product_tags_tag (tag, product_id),
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("SHOW INDEX FROM product_attributes")
+    if 'idx_product_attributes_product_type' not in {row[2] for row in cursor.fetchall()}:
+        cursor.execute(
+            "ALTER TABLE product_attributes "
+            "ADD INDEX idx_product_attributes_product_type (product_id, attribute_type)"
+        )
+
+    # The legacy copies stay until migration 7, so older processes keep working
+    backfill_product_tags(cursor, conn)
+
+
+@migration(7, "Drop legacy ai_keys copies (product_attributes rows, products.ai_keys)", manual=True)
+def drop_legacy_ai_keys(cursor, conn):
+    # Pick up tags older processes added or removed since migration 6
+    added, removed = resync_product_tags(cursor, conn)
+    if added or removed:
+        print(f"product_tags re-synced from legacy ai_keys: {added} added, {removed} removed")
+    cursor.execute("DELETE FROM product_attributes WHERE attribute_type = %s", ('ai_keys',))
+    conn.commit()
+    cursor.execute("SHOW COLUMNS FROM products LIKE 'ai_keys'")
+    if cursor.fetchall():
+        cursor.execute("ALTER TABLE products DROP COLUMN ai_keys")
+
+
+def _current_version(cursor):
+    try:
+        cursor.execute("SELECT version FROM schema_version ORDER BY version DESC LIMIT 1")
+    except Error as e:
+        if e.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        return 0
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _apply_pending(cursor, conn, include_manual=False):
+    current = _current_version(cursor)
+    applied = []
+    for version, description, func in _pending(current, include_manual):
+        print(f"Applying schema migration {version}: {description}")
+        func(cursor, conn)
+        cursor.execute(
+            "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        conn.commit()
+        applied.append(version)
+    return applied
+
+
+def run_migrations(cursor, conn, database_key=None, include_manual=False):
+    """Bring the schema up to date; cheap no-op when it already is.
+
+    Manual migrations are only applied with ``include_manual=True``.
+    """
+    if database_key is not None:
+        with _checked_lock:
+            if database_key in _checked_databases:
+                return []
+
+    started = time.perf_counter()
+    current = _current_version(cursor)
+    pending = _pending(current, include_manual)
+    target = pending[-1][0] if pending else current
+    if not pending:
+        print(f"Schema up to date (version {target}) in {(time.perf_counter() - started) * 1000:.1f} ms")
+        applied = []
+    else:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK_NAME, SCHEMA_LOCK_TIMEOUT))
+        row = cursor.fetchone()
+        if not row or row[0] != 1:
+            raise Error(msg=f"Could not acquire schema migration lock '{SCHEMA_LOCK_NAME}'")
+        try:
+            # Another process may have migrated while we waited for the lock
+            applied = _apply_pending(cursor, conn, include_manual)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK_NAME,))
+            cursor.fetchall()
+        print(f"Schema migrated to version {target} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    manual = [version for version, _, _ in _pending(target, include_manual=True) if version in MANUAL_MIGRATIONS]
+    if manual:
+        print(f"Manual schema migration {manual[0]} is pending; run `python migrations.py --apply-manual` "
+              f"once no older app version is running")
+
+    # Dining tables are small; re-derive keys of rows added or renamed by hand
+    try:
+        fixed = refresh_dining_table_keys(cursor, conn)
+        if fixed:
+            print(f"Re-derived lookup keys for {fixed} dining tables")
+    except Error as e:
+        print(f"Warning: Could not check dining table lookup keys: {e}")
+
+    if database_key is not None:
+        with _checked_lock:
+            _checked_databases.add(database_key)
+    return applied
+
+
+if __name__ == '__main__':
+    import argparse
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='web_store schema maintenance')
+    parser.add_argument('--backfill-product-tags', action='store_true',
+                        help='Copy legacy ai_keys (product_attributes rows, products.ai_keys) into product_tags')
+    parser.add_argument('--apply-manual', action='store_true',
+                        help='Also apply manual migrations (e.g. dropping the legacy ai_keys copies)')
+    args = parser.parse_args()
+
+    db = Database()
+    try:
+        if args.backfill_product_tags:
+            copied = backfill_product_tags(db.cursor, db.conn)
+            print(f"Backfill finished: {copied} tags copied")
+        if args.apply_manual:
+            applied = run_migrations(db.cursor, db.conn, include_manual=True)
+            print(f"Applied migrations: {applied or 'none'}")
+    finally:
+        db.close()
@@ -0,0 +1,186 @@
+"""Order lifecycle events for the Server-Sent Events stream.
+
+OrderChangeFeed polls the orders change feed (the one behind GET
+/orders/changes) and publishes what it finds to the process's
+OrderEventBus, so subscribers see changes made by any process: other API
+workers, the Tk apps or scripts.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_BUFFER_SIZE = 1000
+# How often each process polls the change feed while someone is subscribed
+ORDER_FEED_POLL_SECONDS = float(os.environ.get('WEB_STORE_ORDER_FEED_POLL_SECONDS', '1'))
+# Last known status per order, used to tell status changes from other edits
+MAX_TRACKED_STATUSES = 10000
+
+
+class OrderEventBus:
+    """Publishes order events and keeps the most recent ones for replay.
+
+    Event ids increase monotonically within the process. Subscribers resume
+    with the last id they saw; if that id has already left the ring buffer
+    (or belongs to a previous process) they are told to resynchronize.
+    """
+
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE):
+        self._events = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._last_id = 0
+
+    @property
+    def last_id(self):
+        with self._cond:
+            return self._last_id
+
+    def publish(self, event_type, order_id, **data):
+        with self._cond:
+            self._last_id += 1
+            event = {
+                'id': self._last_id,
+                'type': event_type,
+                'order_id': order_id,
+                'data': data,
+                'timestamp': time.time()
+            }
+            self._events.append(event)
+            self._cond.notify_all()
+        return event
+
+    def _events_after(self, last_id):
+        """Return (events, reset) for events newer than ``last_id``; caller holds the lock."""
+        if last_id > self._last_id:
+            return [], True
+        if last_id == self._last_id:
+            return [], False
+        oldest = self._events[0]['id'] if self._events else self._last_id + 1
+        reset = last_id < oldest - 1
+        return [event for event in self._events if event['id'] > last_id], reset
+
+    def wait_for_events(self, last_id, timeout):
+        """Block up to ``timeout`` seconds for events after ``last_id``."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                events, reset = self._events_after(last_id)
+                if events or reset:
+                    return events, reset
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], False
+                self._cond.wait(remaining)
+
+
+class OrderChangeFeed:
+    """One polling thread per process that turns order changes into bus events.
+
+    The thread runs only while at least one stream is subscribed and
+    polls ``order_manager.get_orders_changed_since`` every ``interval``
+    seconds, or right away after wake(). Rows the feed repeats within its
+    overlap window are published once.
+    """
+
+    def __init__(self, bus, order_manager, interval=ORDER_FEED_POLL_SECONDS):
+        self.bus = bus
+        self.order_manager = order_manager
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = 0
+        self._thread = None
+        self._version = None
+        # Rows and deletions the previous poll published (the next one repeats some)
+        self._seen = {}
+        self._seen_deleted = set()
+        self._statuses = OrderedDict()
+
+    def subscribe(self):
+        with self._lock:
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='order-change-feed', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    def wake(self):
+        """Poll now, e.g. after this process changed an order."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._subscribers <= 0:
+                    # Changes made while nobody listened are not replayed
+                    self._thread = None
+                    self._version = None
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Order change feed poll failed: {e}")
+            finally:
+                self.order_manager.db.release()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        """Publish changes since the previous poll; returns how many events were published."""
+        if self._version is None:
+            self._version = self.order_manager.get_change_version()
+            return 0
+        previous = self._version
+        changes = self.order_manager.get_orders_changed_since(previous)
+        if changes is None:
+            return 0
+        self._version = changes['version']
+        if changes['reset']:
+            # Fell behind the deletion log: subscribers must resynchronize
+            self._seen = {}
+            self._seen_deleted = set()
+            self.bus.publish('reset', None)
+            return 1
+
+        since = self.order_manager._parse_change_version(previous)
+        published = 0
+        seen = {}
+        for order in reversed(changes['orders']):
+            order_id = order['id']
+            updated_at = order.get('updated_at')
+            seen[order_id] = updated_at
+            if self._seen.get(order_id) == updated_at:
+                continue
+            status = order.get('status')
+            known_status = self._statuses.pop(order_id, None)
+            self._statuses[order_id] = status
+            if len(self._statuses) > MAX_TRACKED_STATUSES:
+                self._statuses.popitem(last=False)
+            data = {'status': status, 'table_number': order.get('table_number')}
+            created_at = order.get('created_at')
+            if known_status is None and created_at is not None and created_at > since:
+                event_type = 'order.created'
+            elif known_status is not None and known_status != status:
+                event_type = 'order.status_changed'
+            else:
+                event_type = 'order.updated'
+            self.bus.publish(event_type, order_id, **data)
+            published += 1
+        deleted = set(changes['deleted'])
+        for order_id in sorted(deleted - self._seen_deleted):
+            self._statuses.pop(order_id, None)
+            self.bus.publish('order.deleted', order_id)
+            published += 1
+        self._seen = seen
+        self._seen_deleted = deleted
+        return published
+
+
+def format_sse(event):
+    payload = {'order_id': event['order_id'], 'timestamp': event['timestamp']}
+    payload.update(event['data'])
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(payload, default=str)}\n\n"
@@ -1,5 +1,8 @@
 ﻿from database import Database
 from mysql.connector import Error
+from text_utils import table_lookup_key
+from qr_service import get_qr_service
+from datetime import datetime
 import json
 
 
@@ -13,6 +16,32 @@ ORDER_STATUSES = (
     "served"
 )
 
+ORDER_COLUMNS = (
+    "id",
+    "customer_name",
+    "total_price",
+    "status",
+    "created_at",
+    "order_type",
+    "payment_method",
+    "table_number",
+    "needs_assistance",
+    "note",
+    "customer_email",
+    "email_receipt",
+    "payment_status",
+    "qr_code_data",
+    "updated_at"
+)
+
+MAX_ORDERS_PAGE_SIZE = 500
+
+# The changes feed re-delivers the last few seconds on every poll so rows
+# written by transactions that commit late are not skipped.
+CHANGE_FEED_OVERLAP_SECONDS = 2
+CHANGE_FEED_RETENTION_DAYS = 7
+CHANGE_VERSION_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
 STATUS_TRANSITIONS = {
     "pending": {"confirmed", "cancelled"},
     "confirmed": {"sent_to_kitchen", "cancelled"},
@@ -49,12 +78,13 @@ STATUS_ALIASES = {
 
 
 class OrderManager:
-    def __init__(self):
+    def __init__(self, db=None, qr_service=None):
         try:
-            self.db = Database()
+            self.db = db if db is not None else Database()
         except Exception as e:
             print(f"Error initializing OrderManager: {e}")
             raise
+        self.qr_service = qr_service if qr_service is not None else get_qr_service()
         self.last_error = None
         self.last_assigned_table = None
         self.last_error_code = None
@@ -104,15 +134,7 @@ class OrderManager:
         return lowered or text
 
     def _table_lookup_key(self, value):
-        if value is None:
-            return None
-        text = str(value).strip().lower()
-        if not text:
-            return None
-        for token in ("bàn", "ban", "table", "tbl", "#"):
-            text = text.replace(token, "")
-        text = "".join(ch for ch in text if ch.isalnum())
-        return text
+        return table_lookup_key(value)
 
     def _should_auto_assign_table(self, order_type):
         if order_type is None:
@@ -130,20 +152,25 @@ class OrderManager:
         try:
             table_row = None
             if requested:
-                cursor.execute(
-                    "SELECT id, table_number, display_name, is_occupied, current_order_id FROM dining_tables FOR UPDATE"
-                )
-                rows = cursor.fetchall()
-                for row in rows:
-                    number_key = self._table_lookup_key(row.get("table_number"))
-                    display_key = self._table_lookup_key(row.get("display_name"))
-                    if requested_key:
-                        if number_key == requested_key or display_key == requested_key:
-                            table_row = row
-                            break
-                    if row.get("table_number") == requested:
-                        table_row = row
-                        break
+                # Resolve the id through the key indexes without locking, then
+                # lock only that row by primary key.
+                if requested_key:
+                    cursor.execute(
+                        "SELECT id FROM dining_tables WHERE number_key = %s OR display_key = %s OR table_number = %s ORDER BY id LIMIT 1",
+                        (requested_key, requested_key, requested)
+                    )
+                else:
+                    cursor.execute(
+                        "SELECT id FROM dining_tables WHERE table_number = %s LIMIT 1",
+                        (requested,)
+                    )
+                match = cursor.fetchone()
+                if match:
+                    cursor.execute(
+                        "SELECT id, table_number, display_name, is_occupied, current_order_id FROM dining_tables WHERE id = %s FOR UPDATE",
+                        (match["id"],)
+                    )
+                    table_row = cursor.fetchone()
                 if not table_row:
                     raise ValueError(f"Ban {requested_table or requested} khong ton tai")
                 if table_row["is_occupied"] and table_row.get("current_order_id") not in (None, order_id):
@@ -217,50 +244,68 @@ class OrderManager:
         if not isinstance(items, list) or len(items) == 0:
             raise ValueError("Danh sach san pham phai la list va khong duoc rong")
 
-        sanitized_items = []
-        total_price = 0.0
+        errors = []
+        parsed_items = []
 
         for index, item in enumerate(items, start=1):
             if not isinstance(item, dict):
-                raise ValueError(f"Item thu {index} phai la dictionary")
+                errors.append(f"Item thu {index} phai la dictionary")
+                continue
 
             if "product_id" not in item or "quantity" not in item:
-                raise ValueError(f"Item thu {index} phai co product_id va quantity")
+                errors.append(f"Item thu {index} phai co product_id va quantity")
+                continue
 
             try:
                 product_id = int(item["product_id"])
                 quantity = int(item["quantity"])
             except (TypeError, ValueError):
-                raise ValueError(f"product_id va quantity trong item thu {index} phai la so nguyen")
+                errors.append(f"product_id va quantity trong item thu {index} phai la so nguyen")
+                continue
 
             if product_id <= 0 or quantity <= 0:
-                raise ValueError(f"product_id va quantity trong item thu {index} phai lon hon 0")
-
-            self.db.cursor.execute(
-                "SELECT price FROM products WHERE id = %s",
-                (product_id,)
-            )
-            product = self.db.cursor.fetchone()
-            if not product:
-                raise ValueError(f"San pham voi ID {product_id} khong ton tai")
-
-            price = float(product[0])
-            total_price += price * quantity
+                errors.append(f"product_id va quantity trong item thu {index} phai lon hon 0")
+                continue
 
             selected_options = item.get("selected_options")
             if selected_options is not None:
                 try:
                     json.dumps(selected_options)
                 except (TypeError, ValueError):
-                    raise ValueError(f"selected_options trong item thu {index} khong hop le")
+                    errors.append(f"selected_options trong item thu {index} khong hop le")
+                    continue
 
-            sanitized_items.append({
+            parsed_items.append({
                 "product_id": product_id,
                 "quantity": quantity,
                 "selected_options": selected_options
             })
 
-        return sanitized_items, round(total_price, 2)
+        prices = self._fetch_product_prices({item["product_id"] for item in parsed_items})
+        missing = sorted({item["product_id"] for item in parsed_items} - set(prices))
+        for product_id in missing:
+            errors.append(f"San pham voi ID {product_id} khong ton tai")
+
+        if errors:
+            raise ValueError("; ".join(errors))
+
+        total_price = 0.0
+        for item in parsed_items:
+            total_price += prices[item["product_id"]] * item["quantity"]
+
+        return parsed_items, round(total_price, 2)
+
+    def _fetch_product_prices(self, product_ids):
+        """Return {product_id: price} for the given ids in a single query."""
+        if not product_ids:
+            return {}
+        ids = sorted(product_ids)
+        placeholders = ", ".join(["%s"] * len(ids))
+        self.db.cursor.execute(
+            f"SELECT id, price FROM products WHERE id IN ({placeholders})",
+            tuple(ids)
+        )
+        return {row[0]: float(row[1]) for row in self.db.cursor.fetchall()}
 
     def add_order(self, customer_name, items, total_price, status="pending",
                   order_type=None, payment_method=None, table_number=None,
@@ -294,20 +339,16 @@ class OrderManager:
                 except (TypeError, ValueError):
                     total_price_value = computed_total
 
-            next_id = self.db.get_next_id(table="orders")
-            if next_id is None:
-                raise Exception("Khong the tao ID don hang")
-
             normalized_table = self._normalize_table_number(table_number)
             requires_table = self._should_auto_assign_table(order_type)
             if normalized_table:
                 reserved_table_info = self._reserve_table_for_order(
-                    next_id,
+                    None,
                     normalized_table,
                     original_input=table_number
                 )
             elif requires_table:
-                reserved_table_info = self._reserve_table_for_order(next_id, None)
+                reserved_table_info = self._reserve_table_for_order(None, None)
                 if reserved_table_info is None:
                     raise ValueError("Khong con ban trong, vui long cho ban trong truoc khi tao don moi")
 
@@ -321,12 +362,11 @@ class OrderManager:
                 email_receipt_value = False
             payment_status_value = "paid" if str(payment_status).strip().lower() == "paid" else "unpaid"
 
-            sql = '''INSERT INTO orders (id, customer_name, total_price, status,
+            sql = '''INSERT INTO orders (customer_name, total_price, status,
                      order_type, payment_method, table_number, needs_assistance,
                      note, customer_email, email_receipt, payment_status)
-                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'''
+                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'''
             values = (
-                next_id,
                 str(customer_name).strip(),
                 float(total_price_value),
                 normalized_status,
@@ -340,6 +380,9 @@ class OrderManager:
                 payment_status_value
             )
             self.db.cursor.execute(sql, values)
+            next_id = self.db.cursor.lastrowid
+            if not next_id:
+                raise Exception("Khong the tao ID don hang")
 
             item_sql = '''INSERT INTO order_items (order_id, product_id, quantity, selected_options)
                           VALUES (%s, %s, %s, %s)'''
@@ -469,7 +512,9 @@ class OrderManager:
                 update_fields.append("needs_assistance = %s")
                 update_values.append(needs_assistance_value)
 
-            if update_fields:
+            if update_fields or sanitized_items is not None:
+                # Item edits alone may leave the orders row unchanged
+                update_fields.append("updated_at = CURRENT_TIMESTAMP(6)")
                 update_sql = "UPDATE orders SET " + ", ".join(update_fields) + " WHERE id = %s"
                 update_values.append(order_id)
                 self.db.cursor.execute(update_sql, tuple(update_values))
@@ -614,6 +659,12 @@ class OrderManager:
             )
             self.db.conn.commit()
             print(f"Order {order_id} marked as served")
+            # Render the payment QR in the background so tablets and phones get
+            # it from cache; the order is already served whatever happens there
+            try:
+                self.qr_service.prerender_async(order_id, qr_payload)
+            except Exception as e:
+                print(f"Khong the tao truoc ma QR cho don {order_id}: {e}")
             return qr_payload
         except ValueError as e:
             self.last_error = str(e)
@@ -683,15 +734,29 @@ class OrderManager:
             print(f"Error getting order: {e}")
             return None
 
-    def get_all_orders(self, status=None):
+    def get_all_orders(self, status=None, after_id=None, limit=None, fields=None,
+                       created_from=None, created_to=None):
+        """List orders newest first.
+
+        ``after_id``/``limit`` page through the list by keyset (ids below
+        ``after_id``), ``fields`` restricts the returned columns and
+        ``created_from``/``created_to`` bound ``created_at``.
+        """
         try:
             self.ensure_connection()
             try:
                 self.db.conn.commit()
             except Error:
                 pass
-            sql = '''SELECT * FROM orders'''
-            params = ()
+            columns = "*"
+            if fields:
+                selected = [name for name in ORDER_COLUMNS if name in set(fields)]
+                if "id" not in selected:
+                    selected.insert(0, "id")
+                columns = ", ".join(selected)
+            sql = f"SELECT {columns} FROM orders"
+            conditions = []
+            params = []
 
             if status:
                 if isinstance(status, (list, tuple, set)):
@@ -702,18 +767,33 @@ class OrderManager:
                             normalized_statuses.append(normalized)
                     if normalized_statuses:
                         placeholders = ", ".join(["%s"] * len(normalized_statuses))
-                        sql += f" WHERE status IN ({placeholders})"
-                        params = tuple(normalized_statuses)
+                        conditions.append(f"status IN ({placeholders})")
+                        params.extend(normalized_statuses)
                 else:
                     normalized = self._normalize_status(status)
                     if normalized and normalized in ORDER_STATUSES:
-                        sql += " WHERE status = %s"
-                        params = (normalized,)
-
+                        conditions.append("status = %s")
+                        params.append(normalized)
+
+            if after_id is not None:
+                conditions.append("id < %s")
+                params.append(int(after_id))
+            if created_from is not None:
+                conditions.append("created_at >= %s")
+                params.append(created_from)
+            if created_to is not None:
+                conditions.append("created_at < %s")
+                params.append(created_to)
+
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
             sql += " ORDER BY id DESC"
+            if limit is not None:
+                sql += " LIMIT %s"
+                params.append(max(1, min(int(limit), MAX_ORDERS_PAGE_SIZE)))
             cursor = self.db.conn.cursor(dictionary=True)
             try:
-                cursor.execute(sql, params)
+                cursor.execute(sql, tuple(params))
                 orders = cursor.fetchall()
             finally:
                 cursor.close()
@@ -722,6 +802,90 @@ class OrderManager:
             print(f"Error getting orders: {e}")
             return []
 
+    def _parse_change_version(self, version):
+        try:
+            return datetime.strptime(str(version).strip(), CHANGE_VERSION_FORMAT)
+        except ValueError:
+            raise ValueError(f"Phien ban thay doi khong hop le: {version}")
+
+    def get_orders_changed_since(self, since=None, statuses=None):
+        """Return the orders changed after ``since`` plus a new high-water mark.
+
+        ``since`` is the ``version`` returned by the previous call. Without it
+        (or when it is older than the deletion log) a full snapshot is
+        returned, narrowed to ``statuses`` if given, with ``reset`` set.
+        Incremental results include every status so clients can drop orders
+        that left their filter. Rows changed in the last couple of seconds
+        are repeated on the next poll, so clients should apply them as upserts.
+        Raises ValueError for a malformed ``since``; returns None on database
+        errors.
+        """
+        since_value = self._parse_change_version(since) if since else None
+        try:
+            self.ensure_connection()
+            try:
+                self.db.conn.commit()
+            except Error:
+                pass
+            cursor = self.db.conn.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    "SELECT NOW(6) - INTERVAL %s SECOND AS safe_mark, "
+                    "NOW(6) - INTERVAL %s DAY AS retention_start",
+                    (CHANGE_FEED_OVERLAP_SECONDS, CHANGE_FEED_RETENTION_DAYS)
+                )
+                marks = cursor.fetchone()
+                reset = since_value is None or since_value < marks["retention_start"]
+                orders = []
+                deleted = []
+                if not reset:
+                    cursor.execute(
+                        "SELECT * FROM orders WHERE updated_at > %s ORDER BY id DESC",
+                        (since_value,)
+                    )
+                    orders = cursor.fetchall()
+                    cursor.execute(
+                        "SELECT order_id FROM order_deletions WHERE deleted_at > %s",
+                        (since_value,)
+                    )
+                    deleted = [row["order_id"] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+            if reset:
+                orders = self.get_all_orders(statuses)
+            version = marks["safe_mark"]
+            if since_value is not None and since_value > version:
+                version = since_value
+            return {
+                "orders": orders,
+                "deleted": deleted,
+                "version": version.strftime(CHANGE_VERSION_FORMAT),
+                "reset": reset
+            }
+        except Error as e:
+            print(f"Error getting order changes: {e}")
+            return None
+
+    def get_change_version(self):
+        """Current ``version`` for get_orders_changed_since, without loading any orders.
+
+        Returns None on database errors.
+        """
+        try:
+            self.ensure_connection()
+            cursor = self.db.conn.cursor()
+            try:
+                cursor.execute(
+                    "SELECT NOW(6) - INTERVAL %s SECOND",
+                    (CHANGE_FEED_OVERLAP_SECONDS,)
+                )
+                return cursor.fetchone()[0].strftime(CHANGE_VERSION_FORMAT)
+            finally:
+                cursor.close()
+        except Error as e:
+            print(f"Error getting order change version: {e}")
+            return None
+
     def get_orders_by_statuses(self, statuses):
         return self.get_all_orders(status=statuses)
 
@@ -785,6 +949,12 @@ class OrderManager:
             self._release_table_for_order(order_id)
             self.db.cursor.execute("DELETE FROM order_items WHERE order_id = %s", (order_id,))
             self.db.cursor.execute("DELETE FROM orders WHERE id = %s", (order_id,))
+            # Tombstone for the changes feed; old ones are pruned as we go
+            self.db.cursor.execute("REPLACE INTO order_deletions (order_id) VALUES (%s)", (order_id,))
+            self.db.cursor.execute(
+                "DELETE FROM order_deletions WHERE deleted_at < NOW(6) - INTERVAL %s DAY",
+                (CHANGE_FEED_RETENTION_DAYS,)
+            )
             self.db.conn.commit()
             print(f"Order {order_id} deleted successfully")
             return True
@@ -1,15 +1,31 @@
 from database import Database
-from mysql.connector import Error
-import os
+from catalog_cache import CatalogCache
+from search_index import ProductSearchIndex
+from facet_index import FacetIndex, MATCH_ALL
+from text_utils import parse_ai_keys
+from mysql.connector import Error, errorcode
 import json
+import os
+
+# Values of the products.category ENUM
+PRODUCT_CATEGORIES = ('cake', 'food', 'drink')
+
+
+def legacy_ai_keys_value(tags):
+    """products.ai_keys value for ``tags``, in the format older processes wrote."""
+    return json.dumps(sorted(set(tags))) if tags else None
+
 
 class ProductManager:
-    def __init__(self):
+    def __init__(self, db=None):
         try:
-            self.db = Database()
+            self.db = db if db is not None else Database()
         except Exception as e:
             print(f"Error initializing ProductManager: {e}")
             raise
+        self.catalog_cache = CatalogCache()
+        # Whether products.ai_keys still exists; None until first checked
+        self._legacy_ai_keys = None
 
     def ensure_connection(self):
         self.db.reconnect_if_needed()
@@ -28,93 +44,62 @@ class ProductManager:
             
         return attributes
 
-    def _parse_ai_keys_field(self, raw):
-        """Return normalized list of ai_keys from assorted storage formats."""
-        keys = []
-        if not raw:
-            return keys
-        if isinstance(raw, (list, tuple, set)):
-            for item in raw:
-                item_str = str(item).strip()
-                if item_str:
-                    keys.append(item_str)
-            return keys
-        if isinstance(raw, str):
-            candidate = raw.strip()
-            if not candidate:
-                return keys
-            try:
-                parsed = json.loads(candidate)
-            except json.JSONDecodeError:
-                for token in candidate.replace(';', ',').split(','):
-                    token = token.strip()
-                    if token:
-                        keys.append(token)
-                if not keys:
-                    keys.append(candidate)
-                return keys
-            else:
-                if isinstance(parsed, str):
-                    parsed = [parsed]
-                if isinstance(parsed, (list, tuple, set)):
-                    for item in parsed:
-                        item_str = str(item).strip()
-                        if item_str:
-                            keys.append(item_str)
-                return keys
-        item_str = str(raw).strip()
-        if item_str:
-            keys.append(item_str)
-        return keys
-
     def _attach_filters(self, product):
-        """Populate product['filters'] with normalized ai_keys when available."""
-        ai_keys = set()
-
-        attrs = product.get('attributes')
-        if isinstance(attrs, dict):
-            raw_attr_keys = attrs.get('ai_keys')
-            for item in self._parse_ai_keys_field(raw_attr_keys):
-                ai_keys.add(item)
-
-        if 'ai_keys' in product:
-            for item in self._parse_ai_keys_field(product.get('ai_keys')):
-                ai_keys.add(item)
-
-        if ai_keys:
-            product['filters'] = {'ai_keys': sorted(ai_keys)}
+        """Populate product['filters'] from the product's tags."""
+        tags = product.get('ai_keys') or []
+        if tags:
+            product['filters'] = {'ai_keys': sorted(tags)}
         elif 'filters' in product:
             product['filters'].pop('ai_keys', None)
             if not product['filters']:
                 product.pop('filters', None)
         return product
 
-    def _update_product_ai_keys(self, product_id, attributes):
-        """Persist ai_keys list to products.ai_keys column for faster lookups."""
-        try:
-            keys = []
-            if isinstance(attributes, dict) and 'ai_keys' in attributes:
-                keys = [item.strip() for item in self._parse_ai_keys_field(attributes.get('ai_keys')) if item.strip()]
-            keys_json = json.dumps(sorted(set(keys))) if keys else None
-            self.db.cursor.execute("UPDATE products SET ai_keys = %s WHERE id = %s", (keys_json, product_id))
-        except Error as e:
-            print(f"Warning: Could not update ai_keys for product {product_id}: {e}")
+    def _split_ai_keys(self, attributes):
+        """Remove ai_keys from ``attributes`` and return them as a sorted unique list."""
+        if not isinstance(attributes, dict) or 'ai_keys' not in attributes:
+            return []
+        return sorted(set(parse_ai_keys(attributes.pop('ai_keys'))))
+
+    def _replace_product_tags(self, product_id, tags):
+        """Store ``tags`` as the product's rows in product_tags."""
+        self.db.cursor.execute("DELETE FROM product_tags WHERE product_id = %s", (product_id,))
+        if tags:
+            self.db.cursor.executemany(
+                "INSERT INTO product_tags (product_id, tag) VALUES (%s, %s)",
+                [(product_id, tag) for tag in tags]
+            )
+        if self.has_legacy_ai_keys_column():
+            # Older processes read the JSON copy, and migration 7 re-syncs
+            # product_tags from it, so it must follow every write until dropped
+            try:
+                self.db.cursor.execute(
+                    "UPDATE products SET ai_keys = %s WHERE id = %s",
+                    (legacy_ai_keys_value(tags), product_id)
+                )
+            except Error as e:
+                if e.errno != errorcode.ER_BAD_FIELD_ERROR:
+                    raise
+                self._legacy_ai_keys = False
+
+    def has_legacy_ai_keys_column(self):
+        """Whether products.ai_keys exists (checked once per process)."""
+        if self._legacy_ai_keys is None:
+            self.db.cursor.execute("SHOW COLUMNS FROM products LIKE 'ai_keys'")
+            self._legacy_ai_keys = bool(self.db.cursor.fetchall())
+        return self._legacy_ai_keys
 
     def add_product(self, name, price, category, quantity=0, description=None, image_url=None, attributes=None):
         try:
             self.ensure_connection()
             
-            # Get next available ID
-            next_id = self.db.get_next_id()
-            if next_id is None:
-                raise Exception("Could not generate product ID")
-
-            # Insert product with specific ID
-            sql = '''INSERT INTO products (id, name, price, category, quantity, description, image_url) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)'''
-            values = (next_id, name, price, category, quantity, description, image_url)
+            # Insert product; the id comes from AUTO_INCREMENT
+            sql = '''INSERT INTO products (name, price, category, quantity, description, image_url) 
+                    VALUES (%s, %s, %s, %s, %s, %s)'''
+            values = (name, price, category, quantity, description, image_url)
             
             self.db.cursor.execute(sql, values)
+            next_id = self.db.cursor.lastrowid
             
             # Extract attributes from name and description
             extracted_attrs = self._extract_attributes_from_text(name, description)
@@ -133,6 +118,7 @@ class ProductManager:
                     if value not in attributes[attr_type]: # Avoid duplicates
                         attributes[attr_type].append(value)
 
+            tags = self._split_ai_keys(attributes)
             if attributes:
                 attr_sql = '''INSERT INTO product_attributes 
                             (product_id, attribute_type, attribute_value) 
@@ -149,8 +135,9 @@ class ProductManager:
                 if attr_values:
                     self.db.cursor.executemany(attr_sql, attr_values)
 
-            self._update_product_ai_keys(next_id, attributes)
+            self._replace_product_tags(next_id, tags)
             self.db.conn.commit()
+            self.catalog_cache.invalidate()
             print(f"Product added successfully with ID: {next_id}")
             return next_id
             
@@ -216,6 +203,7 @@ class ProductManager:
                     if value not in attributes[attr_type]: # Avoid duplicates
                         attributes[attr_type].append(value)
 
+            tags = self._split_ai_keys(attributes)
             if attributes:
                 # Delete existing attributes
                 self.db.cursor.execute(
@@ -244,8 +232,9 @@ class ProductManager:
                     (product_id,)
                 )
 
-            self._update_product_ai_keys(product_id, attributes)
+            self._replace_product_tags(product_id, tags)
             self.db.conn.commit()
+            self.catalog_cache.invalidate()
             print(f"Product {product_id} updated successfully")
             return True
             
@@ -255,137 +244,140 @@ class ProductManager:
                 self.db.conn.rollback()
             return False
 
+    def _fetch_products(self, where=None, params=()):
+        """Load products matching ``where`` (over alias ``p``) with attributes and tags.
+
+        Products, attributes and tags are read as separate result sets and
+        merged in one pass, so values may contain any character and are never
+        truncated by group_concat_max_len.
+        """
+        sql = "SELECT p.* FROM products p"
+        attr_sql = "SELECT pa.product_id, pa.attribute_type, pa.attribute_value FROM product_attributes pa"
+        tag_sql = "SELECT pt.product_id, pt.tag FROM product_tags pt"
+        if where:
+            sql += f" WHERE {where}"
+            attr_sql += f" JOIN products p ON p.id = pa.product_id WHERE {where}"
+            tag_sql += f" JOIN products p ON p.id = pt.product_id WHERE {where}"
+        sql += " ORDER BY p.id"
+        attr_sql += " ORDER BY pa.product_id, pa.id"
+        tag_sql += " ORDER BY pt.product_id, pt.tag"
+
+        cursor = self.db.conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, tuple(params))
+            products = cursor.fetchall()
+            if not products:
+                return []
+            attributes_by_product = {}
+            cursor.execute(attr_sql, tuple(params))
+            for row in cursor:
+                if row['attribute_type'] == 'ai_keys':
+                    # Legacy copy kept for older processes until migration 7
+                    continue
+                attrs = attributes_by_product.setdefault(row['product_id'], {})
+                attrs.setdefault(row['attribute_type'], []).append(row['attribute_value'])
+            tags_by_product = {}
+            cursor.execute(tag_sql, tuple(params))
+            for row in cursor:
+                tags_by_product.setdefault(row['product_id'], []).append(row['tag'])
+        finally:
+            cursor.close()
+
+        for product in products:
+            product['attributes'] = attributes_by_product.get(product['id'])
+            product['ai_keys'] = tags_by_product.get(product['id'], [])
+            self._attach_filters(product)
+        return products
+
     def get_product(self, product_id):
         try:
             self.ensure_connection()
-            
-            # Get product details
-            sql = '''SELECT p.*, GROUP_CONCAT(
-                        CONCAT(pa.attribute_type, ':', pa.attribute_value)
-                        SEPARATOR '|'
-                    ) as attributes
-                    FROM products p
-                    LEFT JOIN product_attributes pa ON p.id = pa.product_id
-                    WHERE p.id = %s
-                    GROUP BY p.id'''
-            
-            self.db.cursor.execute(sql, (product_id,))
-            result = self.db.cursor.fetchone()
-            
-            if not result:
-                return None
-                
-            # Convert result to dictionary
-            columns = [desc[0] for desc in self.db.cursor.description]
-            product = dict(zip(columns, result))
-            
-            # Parse attributes
-            if product['attributes']:
-                attrs = {}
-                for attr in product['attributes'].split('|'):
-                    attr_type, attr_value = attr.split(':')
-                    if attr_type not in attrs:
-                        attrs[attr_type] = []
-                    attrs[attr_type].append(attr_value)
-                product['attributes'] = attrs
-
-            self._attach_filters(product)
-            return product
+            products = self._fetch_products("p.id = %s", (product_id,))
+            return products[0] if products else None
             
         except Error as e:
             print(f"Error getting product: {e}")
             return None
 
+    def _cached_products(self, category=None):
+        """Return the shared cached product list, loading it on a miss (None on error)."""
+        if category and category not in PRODUCT_CATEGORIES:
+            # No product can have it; never create cache entries for arbitrary input
+            return []
+        cached = self.catalog_cache.get(category)
+        if cached is not None:
+            return cached
+        cache_version = self.catalog_cache.version
+        products = self._load_all_products(category)
+        if products is not None:
+            self.catalog_cache.put(category, cache_version, products)
+        return products
+
     def get_all_products(self, category=None):
+        products = self._cached_products(category)
+        if products is None:
+            return []
+        # Shallow copies so callers can reshape fields without touching the cache
+        return [dict(product) for product in products]
+
+    def _load_all_products(self, category=None):
         try:
             print("Đang kết nối database để lấy sản phẩm...")
             self.ensure_connection()
             print("Đã kết nối database thành công")
-            
-            # Base query
-            sql = '''SELECT p.*, GROUP_CONCAT(
-                        CONCAT(pa.attribute_type, ':', pa.attribute_value)
-                        SEPARATOR '|'
-                    ) as attributes
-                    FROM products p
-                    LEFT JOIN product_attributes pa ON p.id = pa.product_id'''
-            
-            if category:
-                sql += ' WHERE p.category = %s'
-            
-            sql += ' GROUP BY p.id ORDER BY p.id'  # Add ORDER BY to maintain ID sequence
-            
+
             if category:
-                self.db.cursor.execute(sql, (category,))
+                products = self._fetch_products("p.category = %s", (category,))
             else:
-                self.db.cursor.execute(sql)
-                
-            results = self.db.cursor.fetchall()
-            print(f"Đã tìm thấy {len(results)} sản phẩm")
-            
-            # Convert results to list of dictionaries
-            columns = [desc[0] for desc in self.db.cursor.description]
-            products = []
-            
-            for result in results:
-                product = dict(zip(columns, result))
-                
-                # Parse attributes
-                if product['attributes']:
-                    attrs = {}
-                    for attr in product['attributes'].split('|'):
-                        attr_type, attr_value = attr.split(':')
-                        if attr_type not in attrs:
-                            attrs[attr_type] = []
-                        attrs[attr_type].append(attr_value)
-                    product['attributes'] = attrs
-
-                self._attach_filters(product)
-                products.append(product)
-                
+                products = self._fetch_products()
+            print(f"Đã tìm thấy {len(products)} sản phẩm")
             return products
             
         except Error as e:
             print(f"Lỗi khi lấy sản phẩm từ database: {e}")
-            return []
+            return None
+
+    def _facet_index(self):
+        """Return the ai_keys FacetIndex for the cached catalog (None on error)."""
+        cache_version = self.catalog_cache.version
+        products = self._cached_products()
+        if products is None:
+            return None
+        index = self.catalog_cache.get_derived(None, 'facet_index')
+        if index is None:
+            index = FacetIndex(products)
+            self.catalog_cache.put_derived(None, cache_version, 'facet_index', index)
+        return index
 
     def get_filter_options(self, category=None):
         """Return sorted unique ai_keys available for the given category."""
-        try:
-            self.ensure_connection()
-            keys = set()
-
-            attr_sql = (
-                "SELECT DISTINCT pa.attribute_value "
-                "FROM product_attributes pa "
-                "JOIN products p ON pa.product_id = p.id "
-                "WHERE pa.attribute_type = %s"
-            )
-            params = ['ai_keys']
-            if category:
-                attr_sql += " AND p.category = %s"
-                params.append(category)
-            self.db.cursor.execute(attr_sql, tuple(params))
-            for (value,) in self.db.cursor.fetchall():
-                value = (value or '').strip()
-                if value:
-                    keys.add(value)
-
-            col_sql = "SELECT ai_keys FROM products"
-            col_params = []
-            if category:
-                col_sql += " WHERE category = %s"
-                col_params.append(category)
-            self.db.cursor.execute(col_sql, tuple(col_params))
-            for (raw,) in self.db.cursor.fetchall():
-                for item in self._parse_ai_keys_field(raw):
-                    if item:
-                        keys.add(item)
-
-            return sorted(keys)
-        except Error as e:
-            print(f"Error fetching filter options: {e}")
-            return []
+        index = self._facet_index()
+        return index.options(category) if index else []
+
+    def get_product_ids_with_ai_keys(self, ai_keys, match=MATCH_ALL, category=None):
+        """Ids of products tagged with all (or ``match='any'``) of ``ai_keys``.
+
+        Returns None when ``ai_keys`` is empty, meaning "no tag filter".
+        """
+        index = self._facet_index()
+        if index is None:
+            return set()
+        return index.matching_ids(ai_keys, match=match, category=category)
+
+    def filter_by_ai_keys(self, ai_keys, match=MATCH_ALL, category=None):
+        """Return (products, facet_counts) for an ai_keys selection within ``category``.
+
+        ``facet_counts`` maps every ai_key of the category to the number of
+        selected products that also carry it.
+        """
+        index = self._facet_index()
+        if index is None:
+            return [], {}
+        ids = index.matching_ids(ai_keys, match=match, category=category)
+        products = self._cached_products(category) or []
+        if ids is not None:
+            products = [product for product in products if product['id'] in ids]
+        return [dict(product) for product in products], index.counts(category, within=ids)
 
     def delete_product(self, product_id):
         try:
@@ -402,6 +394,7 @@ class ProductManager:
             
             rows_affected = self.db.cursor.rowcount
             if rows_affected > 0:
+                self.catalog_cache.invalidate()
                 print(f"Product {product_id} deleted successfully")
                 
                 # Xóa tệp hình ảnh nếu tồn tại
@@ -420,49 +413,49 @@ class ProductManager:
                 self.db.conn.rollback()
             return False
 
-    def search_products(self, keyword):
-        try:
-            self.ensure_connection()
-            
-            sql = '''SELECT p.*, GROUP_CONCAT(
-                        CONCAT(pa.attribute_type, ':', pa.attribute_value)
-                        SEPARATOR '|'
-                    ) as attributes
-                    FROM products p
-                    LEFT JOIN product_attributes pa ON p.id = pa.product_id
-                    WHERE p.name LIKE %s OR p.description LIKE %s
-                    GROUP BY p.id
-                    ORDER BY p.id'''
-            
-            search_term = f'%{keyword}%'
-            self.db.cursor.execute(sql, (search_term, search_term))
-            results = self.db.cursor.fetchall()
-            
-            # Convert results to list of dictionaries
-            columns = [desc[0] for desc in self.db.cursor.description]
-            products = []
-            
-            for result in results:
-                product = dict(zip(columns, result))
-                
-                # Parse attributes
-                if product['attributes']:
-                    attrs = {}
-                    for attr in product['attributes'].split('|'):
-                        attr_type, attr_value = attr.split(':')
-                        if attr_type not in attrs:
-                            attrs[attr_type] = []
-                        attrs[attr_type].append(attr_value)
-                    product['attributes'] = attrs
-
-                self._attach_filters(product)
-                products.append(product)
-                
-            return products
-            
-        except Error as e:
-            print(f"Error searching products: {e}")
+    def _search_index(self):
+        """Return the ProductSearchIndex for the cached catalog (None on error)."""
+        cache_version = self.catalog_cache.version
+        products = self._cached_products()
+        if products is None:
+            return None
+        index = self.catalog_cache.get_derived(None, 'search_index')
+        if index is None:
+            index = ProductSearchIndex(products)
+            self.catalog_cache.put_derived(None, cache_version, 'search_index', index)
+        return index
+
+    def warm_cache(self):
+        """Load the catalog with its search and facet indexes; returns the categories seen."""
+        products = self._cached_products()
+        if products is None:
+            return []
+        self._search_index()
+        self._facet_index()
+        categories = sorted({product['category'] for product in products if product.get('category')})
+        for category in categories:
+            self._cached_products(category)
+        return categories
+
+    def search_catalog(self, query, category=None, limit=None):
+        """Rank catalog products for ``query`` with the in-memory search index.
+
+        Matching ignores Vietnamese diacritics ("banh kem" finds "Bánh kem"),
+        accepts word prefixes and scores name matches above keywords/ai_keys
+        and description. Each result carries its ``search_score``.
+        """
+        index = self._search_index()
+        if index is None:
             return []
+        return [
+            dict(product, search_score=round(score, 3))
+            for product, score in index.search(query, category=category, limit=limit)
+        ]
+
+    def search_products(self, keyword):
+        if not keyword or not str(keyword).strip():
+            return self.get_all_products()
+        return self.search_catalog(keyword)
 
     def close(self):
         if self.db:
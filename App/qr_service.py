@@ -0,0 +1,203 @@
+"""Payment QR codes rendered once per (order_id, qr_code_data) and cached.
+
+Renders are kept in a small in-memory LRU and as files in the QR cache
+directory, named after a hash of the order id and payload, so API workers,
+the staff app and restarts all reuse the same PNG/SVG bytes. The directory
+is pruned by age and file count; a pruned code is simply rendered again.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import qrcode
+    import qrcode.image.svg
+except ImportError:  # optional: only processes that render QR codes need it
+    qrcode = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QR_CACHE_DIR = os.environ.get(
+    'WEB_STORE_QR_CACHE_DIR', os.path.abspath(os.path.join(BASE_DIR, '..', 'qr_cache'))
+)
+DEFAULT_QR_MEMORY_ITEMS = 256
+DEFAULT_QR_DISK_ITEMS = int(os.environ.get('WEB_STORE_QR_CACHE_MAX_FILES', '2000'))
+DEFAULT_QR_MAX_AGE_DAYS = float(os.environ.get('WEB_STORE_QR_CACHE_MAX_AGE_DAYS', '30'))
+# Writes between two scans of the cache directory
+QR_PRUNE_EVERY = 64
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def qr_digest(order_id, qr_data):
+    return hashlib.sha1(f"{order_id}:{qr_data}".encode('utf-8')).hexdigest()[:20]
+
+
+class QRCodeService:
+    def __init__(self, cache_dir=DEFAULT_QR_CACHE_DIR, memory_items=DEFAULT_QR_MEMORY_ITEMS,
+                 disk_items=DEFAULT_QR_DISK_ITEMS, max_age_days=DEFAULT_QR_MAX_AGE_DAYS):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.max_age_seconds = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'renders': 0, 'pruned_files': 0}
+        self._writes_since_prune = QR_PRUNE_EVERY  # scan on the first write
+        self._executor = None
+        self._executor_pid = None
+
+    def etag(self, order_id, qr_data):
+        return qr_digest(order_id, qr_data)
+
+    def _path(self, order_id, digest, fmt):
+        return os.path.join(self.cache_dir, f"order-{order_id}-{digest}.{fmt}")
+
+    def get(self, order_id, qr_data, fmt='png'):
+        """Return the encoded QR image bytes, rendering and caching on a miss."""
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"Unsupported QR format: {fmt}")
+        digest = qr_digest(order_id, qr_data)
+        key = (digest, fmt)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return data
+
+        path = self._path(order_id, digest, fmt)
+        try:
+            with open(path, 'rb') as handle:
+                data = handle.read()
+            stat = 'disk_hits'
+        except FileNotFoundError:
+            data = self._render(qr_data, fmt)
+            self._write(path, data)
+            stat = 'renders'
+
+        with self._lock:
+            self._stats[stat] += 1
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        return data
+
+    def png(self, order_id, qr_data):
+        return self.get(order_id, qr_data, 'png')
+
+    def svg(self, order_id, qr_data):
+        return self.get(order_id, qr_data, 'svg')
+
+    def prerender(self, order_id, qr_data):
+        """Render every format ahead of the first request; failures are only logged."""
+        for fmt in QR_FORMATS:
+            try:
+                self.get(order_id, qr_data, fmt)
+            except Exception as e:
+                print(f"Could not pre-render {fmt} QR for order {order_id}: {e}")
+
+    def prerender_async(self, order_id, qr_data):
+        """Queue ``prerender`` on a background thread so callers never wait on rendering."""
+        try:
+            self._background().submit(self.prerender, order_id, qr_data)
+        except Exception as e:
+            print(f"Could not queue QR pre-render for order {order_id}: {e}")
+
+    def _background(self):
+        with self._lock:
+            # A forked worker inherits the executor object but not its thread
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-prerender')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _render(self, qr_data, fmt):
+        if qrcode is None:
+            raise RuntimeError("qrcode is required to render payment QR codes")
+        qr = qrcode.QRCode(box_size=QR_BOX_SIZE, border=QR_BORDER)
+        qr.add_data(qr_data)
+        qr.make(fit=True)
+        buffer = io.BytesIO()
+        if fmt == 'svg':
+            qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        else:
+            qr.make_image().save(buffer)
+        return buffer.getvalue()
+
+    def _write(self, path, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Atomic rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write QR cache file {path}: {e}")
+            return
+        with self._lock:
+            self._writes_since_prune += 1
+            due = self._writes_since_prune >= QR_PRUNE_EVERY
+            if due:
+                self._writes_since_prune = 0
+        if due:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete cache files older than the age limit, then the oldest beyond the file cap."""
+        now = time.time()
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and (entry.name.startswith('order-') or entry.name.endswith('.tmp')):
+                        try:
+                            files.append((entry.stat().st_mtime, entry.path))
+                        except OSError:
+                            continue
+        except OSError as e:
+            print(f"Could not scan QR cache directory {self.cache_dir}: {e}")
+            return 0
+        files.sort()
+        expired = [path for mtime, path in files if now - mtime > self.max_age_seconds]
+        remaining = len(files) - len(expired)
+        if remaining > self.disk_items:
+            expired += [path for _, path in files[len(expired):len(expired) + remaining - self.disk_items]]
+        removed = 0
+        for path in expired:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            with self._lock:
+                self._stats['pruned_files'] += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, memory_items=len(self._memory))
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def get_qr_service():
+    """Process-wide QRCodeService shared by managers and the API."""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = QRCodeService()
+        return _default_service
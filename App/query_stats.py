@@ -0,0 +1,106 @@
+"""Statement shapes, per-request query scopes and caller lookup for Database.
+
+A statement's shape is its SQL with comments dropped and literals,
+placeholders and IN/VALUES lists collapsed to ``?``. It is what the
+slow-query log prints (parameters never are) and what the repeated
+statement (N+1) check counts.
+"""
+import os
+import re
+import sys
+
+# Statements at least this slow are logged; 0 turns the log off
+SLOW_QUERY_MS = float(os.environ.get('WEB_STORE_SLOW_QUERY_MS', '200'))
+# Development mode: track statement shapes per request and warn on N+1 patterns
+QUERY_DEBUG = os.environ.get('WEB_STORE_QUERY_DEBUG', '').lower() in ('1', 'true', 'yes', 'on')
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('WEB_STORE_N_PLUS_ONE_THRESHOLD', '10'))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames in these files are the instrumentation itself, not the caller
+_INTERNAL_FILES = frozenset(
+    os.path.join(BASE_DIR, name) for name in ('database.py', 'query_stats.py')
+)
+
+_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%s")
+_NUMBER_RE = re.compile(r"(?<![\w.`])\d+(?:\.\d+)?(?![\w`])")
+_SPACE_RE = re.compile(r"\s+")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROWS_RE = re.compile(r"\((?:\?|\.\.\.)\)(?:\s*,\s*\((?:\?|\.\.\.)\))+")
+_MAX_SHAPE_CACHE = 2048
+_shapes = {}
+
+
+def sql_shape(sql):
+    """Parameter-free form of ``sql``, e.g. "SELECT id FROM products WHERE id IN (...)"."""
+    shape = _shapes.get(sql)
+    if shape is None:
+        text = sql.decode('utf-8', 'replace') if isinstance(sql, bytes) else str(sql)
+        text = _STRING_RE.sub('?', text)
+        text = _COMMENT_RE.sub(' ', text)
+        text = _PLACEHOLDER_RE.sub('?', text)
+        text = _NUMBER_RE.sub('?', text)
+        text = _SPACE_RE.sub(' ', text).strip()
+        text = _LIST_RE.sub('(...)', text)
+        shape = _ROWS_RE.sub('(...), ...', text)
+        if len(_shapes) < _MAX_SHAPE_CACHE:
+            _shapes[sql] = shape
+    return shape
+
+
+def find_caller():
+    """"file.py:line in function" of the first frame outside the instrumentation."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename not in _INTERNAL_FILES:
+            return f"{os.path.basename(filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryScope:
+    """Statements one thread ran between begin and end, e.g. one HTTP request."""
+
+    __slots__ = ('label', 'count', 'seconds', 'errors', 'shapes', 'parent')
+
+    def __init__(self, label, track_shapes=False, parent=None):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.errors = 0
+        # shape -> executions; only kept in development mode
+        self.shapes = {} if track_shapes else None
+        self.parent = parent
+
+    def add(self, sql, seconds, error=None):
+        """Count one statement; returns how often its shape ran so far (0 if not tracked)."""
+        self.count += 1
+        self.seconds += seconds
+        if error is not None:
+            self.errors += 1
+        if self.shapes is None:
+            return 0
+        shape = sql_shape(sql)
+        runs = self.shapes.get(shape, 0) + 1
+        self.shapes[shape] = runs
+        return runs
+
+    def merge_into(self, parent, threshold):
+        """Add this scope's totals to ``parent`` when it ends inside it.
+
+        Returns [(shape, runs)] for shapes that only crossed ``threshold``
+        in the parent because of this scope, so they can be warned about once.
+        """
+        parent.count += self.count
+        parent.seconds += self.seconds
+        parent.errors += self.errors
+        crossed = []
+        if parent.shapes is not None and self.shapes:
+            for shape, runs in self.shapes.items():
+                before = parent.shapes.get(shape, 0)
+                parent.shapes[shape] = before + runs
+                if before <= threshold < before + runs and runs <= threshold:
+                    crossed.append((shape, before + runs))
+        return crossed
@@ -0,0 +1,108 @@
+"""Request id and phase timings of the API request being handled.
+
+Both live in ContextVars so lower layers (Database, log output) can read
+them without importing Flask. Outside a request the id is None and nothing
+is tagged or timed.
+"""
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+# Ids taken from clients end up in SQL comments and log lines: keep them plain
+_VALID_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = ContextVar('web_store_request_id', default=None)
+_timings = ContextVar('web_store_request_timings', default=None)
+
+
+def new_request_id(incoming=None):
+    """Reuse a well-formed incoming id (e.g. from a proxy), otherwise make one."""
+    if incoming and _VALID_REQUEST_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+def bind(request_id):
+    _request_id.set(request_id)
+    _timings.set({})
+
+
+def clear():
+    _request_id.set(None)
+    _timings.set(None)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def add_timing(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def timings():
+    return dict(_timings.get() or {})
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to phase ``name`` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - started)
+
+
+def format_server_timing(phases):
+    """``Server-Timing`` value from [(name, seconds, description or None)]."""
+    metrics = []
+    for name, seconds, description in phases:
+        metric = f"{name};dur={seconds * 1000:.1f}"
+        if description:
+            metric += f';desc="{description}"'
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class RequestIdStream:
+    """Text stream wrapper that starts every line written during a request with its id."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._state = threading.local()
+
+    def write(self, text):
+        if not text:
+            return 0
+        request_id = _request_id.get()
+        at_line_start = getattr(self._state, 'at_line_start', True)
+        if request_id is None:
+            self._state.at_line_start = text.endswith('\n')
+            return self._stream.write(text)
+        prefix = f"[{request_id}] "
+        parts = []
+        for line in text.splitlines(keepends=True):
+            if at_line_start:
+                parts.append(prefix)
+            parts.append(line)
+            at_line_start = line.endswith('\n')
+        self._state.at_line_start = at_line_start
+        self._stream.write(''.join(parts))
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def install_log_prefix():
+    """Route print() through RequestIdStream (idempotent)."""
+    if not isinstance(sys.stdout, RequestIdStream):
+        sys.stdout = RequestIdStream(sys.stdout)
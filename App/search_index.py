@@ -0,0 +1,82 @@
+"""In-memory inverted index for product search."""
+from bisect import bisect_left
+
+from text_utils import search_tokens
+
+# Relative weight of a token match per product field
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'ai_keys': 2.0,
+    'keywords': 2.0,
+    'description': 1.0
+}
+PREFIX_MATCH_FACTOR = 0.5
+
+
+class ProductSearchIndex:
+    """Token -> product postings built from a materialized catalog list.
+
+    Queries are folded the same way as the indexed text, every query token
+    must match (exactly or as a prefix of an indexed token) and results are
+    ranked by the summed field weights.
+    """
+
+    def __init__(self, products):
+        self._products = {}
+        self._postings = {}
+        for product in products:
+            self._add(product)
+        self._tokens = sorted(self._postings)
+
+    def _add(self, product):
+        product_id = product['id']
+        self._products[product_id] = product
+        attrs = product.get('attributes') if isinstance(product.get('attributes'), dict) else {}
+        filters = product.get('filters') if isinstance(product.get('filters'), dict) else {}
+        fields = {
+            'name': [product.get('name')],
+            'description': [product.get('description')],
+            'keywords': attrs.get('keywords') or [],
+            'ai_keys': filters.get('ai_keys') or []
+        }
+        for field, values in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for value in values:
+                for token in search_tokens(value):
+                    postings = self._postings.setdefault(token, {})
+                    postings[product_id] = postings.get(product_id, 0.0) + weight
+
+    def _scores_for(self, query_token):
+        scores = {}
+        start = bisect_left(self._tokens, query_token)
+        for token in self._tokens[start:]:
+            if not token.startswith(query_token):
+                break
+            factor = 1.0 if token == query_token else PREFIX_MATCH_FACTOR
+            for product_id, weight in self._postings[token].items():
+                scores[product_id] = max(scores.get(product_id, 0.0), weight * factor)
+        return scores
+
+    def search(self, query, category=None, limit=None):
+        """Return [(product, score)] best first for ``query``."""
+        tokens = list(dict.fromkeys(search_tokens(query)))
+        if not tokens:
+            return []
+        totals = None
+        for token in tokens:
+            scores = self._scores_for(token)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {pid: totals[pid] + score for pid, score in scores.items() if pid in totals}
+            if not totals:
+                return []
+        results = [
+            (self._products[pid], score)
+            for pid, score in totals.items()
+            if not category or self._products[pid].get('category') == category
+        ]
+        results.sort(key=lambda item: (-item[1], item[0]['id']))
+        if limit:
+            results = results[:limit]
+        return results
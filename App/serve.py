@@ -0,0 +1,162 @@
+"""Production entry point for the web_store API.
+
+Prefers gunicorn (pre-fork, ``gthread`` workers): the app is imported and
+the catalog cache warmed once in the master, then every worker starts its
+own MySQL pool after fork. Without gunicorn (e.g. on Windows) it falls back
+to waitress, then to werkzeug's threaded server with debugger and reloader
+off.
+
+    python -m App.serve --workers 4 --threads 8          # from the repo root
+    python serve.py --server waitress --threads 16       # from the App directory
+
+gunicorn signals: HUP restarts workers gracefully (new workers are forked
+from the preloaded master, so code changes need USR2 + QUIT or a restart),
+TERM drains in-flight requests for up to --graceful-timeout seconds.
+"""
+import argparse
+import multiprocessing
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 8
+DEFAULT_TIMEOUT = 60
+DEFAULT_GRACEFUL_TIMEOUT = 30
+
+
+def default_workers():
+    return min(multiprocessing.cpu_count() * 2 + 1, 8)
+
+
+def load_app(warm=True):
+    from api import create_app, warm_caches
+    flask_app = create_app({'LOG_REQUEST_ID': True})
+    if warm:
+        try:
+            warm_caches(flask_app)
+        except Exception as e:
+            print(f"Warning: could not warm catalog cache: {e}")
+    return flask_app
+
+
+def _loaded_services(flask_app):
+    """Services already created in this app (None if nothing touched the database yet)."""
+    return flask_app.extensions.get('web_store')
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+    from api import get_services
+
+    flask_app = load_app()
+
+    def post_fork(server, worker):
+        if _loaded_services(flask_app) is not None:
+            # Detects the new pid and gives this worker its own pool now
+            # rather than on its first request
+            get_services(flask_app)
+            server.log.info("Worker %s: database pool reset after fork", worker.pid)
+
+    def worker_exit(server, worker):
+        services = _loaded_services(flask_app)
+        if services is not None:
+            services.db.close()
+
+    class StandaloneApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': 5,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': max(1, args.max_requests // 10) if args.max_requests else 0,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'accesslog': '-' if args.access_log else None,
+    }
+    # The master never serves requests: close its connections so no socket is
+    # inherited by the workers (each one opens its own pool in post_fork)
+    services = _loaded_services(flask_app)
+    if services is not None:
+        services.db.close()
+    StandaloneApplication(flask_app, options).run()
+
+
+def run_waitress(args):
+    from waitress import serve
+
+    flask_app = load_app()
+    serve(flask_app, host=args.host, port=args.port, threads=args.threads,
+          channel_timeout=args.timeout)
+
+
+def run_werkzeug(args):
+    flask_app = load_app()
+    flask_app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=True)
+
+
+SERVERS = {
+    'gunicorn': run_gunicorn,
+    'waitress': run_waitress,
+    'werkzeug': run_werkzeug,
+}
+
+
+def pick_server(name):
+    if name != 'auto':
+        return name
+    for candidate, module in (('gunicorn', 'gunicorn'), ('waitress', 'waitress')):
+        if candidate == 'gunicorn' and sys.platform.startswith('win'):
+            continue
+        try:
+            __import__(module)
+            return candidate
+        except ImportError:
+            continue
+    return 'werkzeug'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the web_store API in production mode')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='Worker processes (gunicorn only)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='Request threads per worker; each open /events/orders stream holds one')
+    parser.add_argument('--server', choices=['auto'] + list(SERVERS), default='auto')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--graceful-timeout', type=int, default=DEFAULT_GRACEFUL_TIMEOUT)
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='Recycle a gunicorn worker after this many requests (0 = never)')
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args(argv)
+
+    server = pick_server(args.server)
+    print(f"Starting web_store API with {server} on {args.host}:{args.port}")
+    SERVERS[server](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,8 @@
+import io
 import json
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 
-import qrcode
 from PIL import Image, ImageTk
 
 import sys
@@ -14,6 +14,7 @@ if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
 from order_manager import OrderManager
+from image_previews import PreviewCache
 
 STATUS_DISPLAY = {
     "pending": "Chờ xác nhận",
@@ -56,7 +57,8 @@ class StaffApp(tk.Tk):
         self.orders_data = {}
         self.current_items = []
         self.selected_order_data = None
-        self.qr_images = []
+        # PhotoImages of rendered QR codes, keyed by the QR cache digest
+        self.qr_images = PreviewCache(capacity=32)
 
         self.status_filter_var = tk.StringVar(value=FILTER_OPTIONS[1][0])
         self.customer_name_var = tk.StringVar()
@@ -71,6 +73,8 @@ class StaffApp(tk.Tk):
         self._known_order_ids = set()
         self._initial_orders_loaded = False
         self._status_snapshot = {}
+        self._orders_cache = {}
+        self._orders_version = None
         self._refresh_in_progress = False
         self._pending_refresh = False
         self.last_refresh_var = tk.StringVar(value="Chưa cập nhật")
@@ -222,7 +226,24 @@ class StaffApp(tk.Tk):
         self._set_buttons_state("disabled")
 
     # --- Data loading ---------------------------------------------------
-    def refresh_orders(self, keep_selection=None):
+    def _sync_orders(self):
+        """Apply the order changes feed to the local cache; return True when it changed."""
+        changes = self.order_manager.get_orders_changed_since(self._orders_version)
+        if changes is None:
+            raise RuntimeError("Không thể tải thay đổi đơn hàng")
+        changed = changes["reset"] or bool(changes["deleted"])
+        if changes["reset"]:
+            self._orders_cache = {}
+        for order_id in changes["deleted"]:
+            self._orders_cache.pop(order_id, None)
+        for order in changes["orders"]:
+            if self._orders_cache.get(order["id"]) != order:
+                self._orders_cache[order["id"]] = order
+                changed = True
+        self._orders_version = changes["version"]
+        return changed
+
+    def refresh_orders(self, keep_selection=None, only_if_changed=False):
         if self._refresh_in_progress:
             self._pending_refresh = True
             return
@@ -247,11 +268,15 @@ class StaffApp(tk.Tk):
             self.refresh_button["state"] = "disabled"
 
         try:
-            all_orders = self.order_manager.get_all_orders()
+            changed = self._sync_orders()
+            all_orders = sorted(self._orders_cache.values(), key=lambda order: order["id"], reverse=True)
         except Exception as exc:  # pylint: disable=broad-except
             self.last_refresh_var.set(f"Lỗi cập nhật lúc {refresh_stamp}")
             messagebox.showerror("Lỗi", f"Không thể tải danh sách đơn hàng:\n{exc}")
         else:
+            if only_if_changed and not changed:
+                self.last_refresh_var.set(f"Cập nhật lúc {refresh_stamp}")
+                return
             current_ids = {order["id"] for order in all_orders}
             status_alerts = []
             new_orders = []
@@ -653,10 +678,15 @@ class StaffApp(tk.Tk):
         except json.JSONDecodeError:
             payload = {"order_id": order_id, "amount": qr_data}
 
-        qr_img = qrcode.make(qr_data)
-        qr_img = qr_img.resize((250, 250))
-        photo = ImageTk.PhotoImage(qr_img)
-        self.qr_images.append(photo)
+        qr_service = self.order_manager.qr_service
+        key = qr_service.etag(order_id, qr_data)
+        photo = self.qr_images.get(key)
+        if photo is None:
+            # PNG is rendered once (usually already by mark_order_served) and cached
+            qr_img = Image.open(io.BytesIO(qr_service.png(order_id, qr_data)))
+            qr_img = qr_img.resize((250, 250), Image.Resampling.NEAREST)
+            photo = ImageTk.PhotoImage(qr_img)
+            self.qr_images.put(key, photo)
 
         ttk.Label(popup, text=f"Don hang #{order_id}", font=("TkDefaultFont", 12, "bold")).pack(pady=(10, 5))
         ttk.Label(popup, image=photo).pack(pady=5)
@@ -683,7 +713,7 @@ class StaffApp(tk.Tk):
         keep_id = None
         if self.selected_order_data:
             keep_id = self.selected_order_data.get("id")
-        self.refresh_orders(keep_selection=keep_id)
+        self.refresh_orders(keep_selection=keep_id, only_if_changed=True)
 
     def _clear_new_order_tags(self, order_ids):
         if not self.orders_tree:
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Modules in App import each other by flat name (``from database import Database``)
+APP_DIR = Path(__file__).resolve().parents[1]
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
@@ -0,0 +1,187 @@
+import gzip
+import os
+from decimal import Decimal
+
+import pytest
+
+import api
+from order_events import OrderChangeFeed, OrderEventBus
+from order_manager import MAX_ORDERS_PAGE_SIZE
+from product_manager import ProductManager
+from query_stats import QueryScope
+
+PRODUCTS = [
+    {'id': 1, 'name': 'Banh kem dau', 'price': Decimal('120000'), 'category': 'cake', 'ai_keys': ['dau', 'kem']},
+    {'id': 2, 'name': 'Banh socola', 'price': Decimal('90000'), 'category': 'cake', 'ai_keys': ['socola']},
+    {'id': 3, 'name': 'Com ga', 'price': Decimal('45000'), 'category': 'food', 'ai_keys': []},
+    {'id': 4, 'name': 'Tra dau', 'price': Decimal('30000'), 'category': 'drink', 'ai_keys': ['dau']},
+]
+
+
+class FakeDatabase:
+    query_debug = False
+
+    def __init__(self):
+        self.scope = None
+
+    def begin_query_scope(self, label):
+        self.scope = QueryScope(label)
+        return self.scope
+
+    def current_query_scope(self):
+        return self.scope
+
+    def end_query_scope(self):
+        scope, self.scope = self.scope, None
+        return scope
+
+    def release(self, discard=False):
+        pass
+
+
+class InMemoryProductManager(ProductManager):
+    """Real caching, facet and search code over PRODUCTS instead of MySQL."""
+
+    def __init__(self, db):
+        super().__init__(db=db)
+        self.loads = 0
+
+    def _load_all_products(self, category=None):
+        self.loads += 1
+        products = []
+        for product in PRODUCTS:
+            if category is None or product['category'] == category:
+                product = dict(product, quantity=5, description=None, image_url=None, attributes=None)
+                products.append(self._attach_filters(product))
+        return products
+
+
+class FakeOrderManager:
+    def __init__(self, db):
+        self.db = db
+        self.orders = [{'id': order_id, 'status': 'pending'} for order_id in range(5, 0, -1)]
+        self.changes = {'orders': [], 'deleted': [], 'version': '2026-01-01 10:00:00.000000', 'reset': False}
+        self.change_calls = []
+
+    def get_all_orders(self, status=None, after_id=None, limit=None, fields=None,
+                       created_from=None, created_to=None):
+        orders = [order for order in self.orders if after_id is None or order['id'] < after_id]
+        if limit is not None:
+            orders = orders[:min(limit, MAX_ORDERS_PAGE_SIZE)]
+        return orders
+
+    def get_orders_changed_since(self, since=None, statuses=None):
+        if since == 'not-a-version':
+            raise ValueError(f"Phien ban thay doi khong hop le: {since}")
+        self.change_calls.append((since, statuses))
+        return self.changes
+
+
+class FakeServices:
+    def __init__(self, config):
+        self.pid = os.getpid()
+        self.db = FakeDatabase()
+        self.product_manager = InMemoryProductManager(self.db)
+        self.order_manager = FakeOrderManager(self.db)
+        self.order_events = OrderEventBus()
+        self.order_feed = OrderChangeFeed(self.order_events, self.order_manager)
+
+    def ensure_process(self):
+        pass
+
+
+@pytest.fixture
+def app():
+    return api.create_app({'SERVICES_FACTORY': FakeServices})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _services(app):
+    return app.extensions['web_store']
+
+
+def test_products_etag_and_not_modified(app, client):
+    first = client.get('/products')
+    assert first.status_code == 200
+    assert [product['id'] for product in first.get_json()] == [1, 2, 3, 4]
+    etag = first.headers['ETag']
+    assert first.headers['Vary'] == 'Accept-Encoding'
+    assert 'X-Request-Id' in first.headers and 'Server-Timing' in first.headers
+
+    cached = client.get('/products', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == etag
+    # The serialized catalog is built once and reused
+    assert _services(app).product_manager.loads == 1
+
+
+def test_products_gzip_has_its_own_etag(client):
+    identity = client.get('/products')
+    compressed = client.get('/products', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] == identity.headers['ETag'][:-1] + '-gzip"'
+    assert gzip.decompress(compressed.data) == identity.data
+
+    # A tag for either encoding identifies the same catalog version
+    cached = client.get('/products', headers={'If-None-Match': compressed.headers['ETag']})
+    assert cached.status_code == 304
+    assert 'Content-Encoding' not in cached.headers
+
+
+def test_products_category_filter(client):
+    response = client.get('/products?category=cake')
+    assert [product['id'] for product in response.get_json()] == [1, 2]
+    assert response.headers['ETag'] != client.get('/products').headers['ETag']
+
+    invalid = client.get('/products?category=pizza')
+    assert invalid.status_code == 400
+    assert 'category=pizza' in invalid.get_json()['error']
+
+
+def test_products_ai_keys_filter(client):
+    assert [p['id'] for p in client.get('/products?ai_keys=dau').get_json()] == [1, 4]
+    assert [p['id'] for p in client.get('/products?ai_keys=dau,kem').get_json()] == [1]
+    assert [p['id'] for p in client.get('/products?ai_keys=dau,socola&match=any').get_json()] == [1, 2, 4]
+    assert [p['id'] for p in client.get('/products?ai_keys=dau&category=drink').get_json()] == [4]
+    assert client.get('/products?ai_keys=dau&match=most').status_code == 400
+
+    tagged = client.get('/products?ai_keys=socola').get_json()[0]
+    assert tagged['attributes'] == [{'type': 'ai_keys', 'value': 'socola'}]
+    assert tagged['price'] == 90000.0
+
+
+def test_orders_keyset_pagination(client):
+    first = client.get('/orders?limit=2')
+    assert [order['id'] for order in first.get_json()] == [5, 4]
+    assert first.headers['X-Next-After-Id'] == '4'
+
+    second = client.get('/orders?limit=2&after_id=4')
+    assert [order['id'] for order in second.get_json()] == [3, 2]
+    assert second.headers['X-Next-After-Id'] == '2'
+
+    last = client.get('/orders?limit=2&after_id=2')
+    assert [order['id'] for order in last.get_json()] == [1]
+    assert 'X-Next-After-Id' not in last.headers
+
+    assert client.get('/orders?after_id=0').status_code == 400
+    assert client.get('/orders?fields=id,secret').status_code == 400
+
+
+def test_order_changes(app, client):
+    response = client.get('/orders/changes?since=2026-01-01 09:59:00.000000&status=pending,confirmed')
+    assert response.status_code == 200
+    assert response.get_json()['version'] == '2026-01-01 10:00:00.000000'
+    assert _services(app).order_manager.change_calls == [
+        ('2026-01-01 09:59:00.000000', ['pending', 'confirmed'])
+    ]
+
+    assert client.get('/orders/changes?since=not-a-version').status_code == 400
+
+    _services(app).order_manager.changes = None
+    assert client.get('/orders/changes').status_code == 500
+
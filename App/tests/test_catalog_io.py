@@ -0,0 +1,100 @@
+import pytest
+from mysql.connector import Error
+
+import catalog_io
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+
+    def execute(self, sql, params=None):
+        if sql.startswith("INSERT INTO products"):
+            table = 'products'
+            self.lastrowid = 100
+            self.conn.product_insert = (sql, params)
+        elif sql.startswith("INSERT INTO product_attributes"):
+            if self.conn.fail_attributes:
+                raise Error(msg="Data too long for column 'attribute_type'")
+            table = 'attributes'
+        else:
+            table = 'tags'
+        (self.conn.pending if self.conn.in_transaction else self.conn.committed).append(table)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Autocommit connection: writes are permanent unless a transaction is open."""
+
+    def __init__(self, fail_attributes=False):
+        self.fail_attributes = fail_attributes
+        self.in_transaction = False
+        self.pending = []
+        self.committed = []
+        self.product_insert = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+        self.in_transaction = False
+
+    def rollback(self):
+        if self.in_transaction:
+            self.pending = []
+        self.in_transaction = False
+
+
+class FakeProductManager:
+    def __init__(self, conn, legacy_ai_keys=False):
+        self.db = type('Db', (), {'conn': conn})()
+        self.legacy_ai_keys = legacy_ai_keys
+
+    def has_legacy_ai_keys_column(self):
+        return self.legacy_ai_keys
+
+    def _extract_attributes_from_text(self, name, description):
+        return {'name': [name], 'keywords': []}
+
+
+def _row(**overrides):
+    raw = {'name': 'Banh kem dau', 'price': '120000', 'category': 'cake', 'ai_keys': 'dau;kem'}
+    raw.update(overrides)
+    return catalog_io.validate_row(raw)
+
+
+def test_failed_attribute_insert_rolls_back_products():
+    conn = FakeConnection(fail_attributes=True)
+    with pytest.raises(Error):
+        catalog_io._insert_chunk(FakeProductManager(conn), [_row()], 1)
+    assert conn.committed == []
+
+
+def test_chunk_commits_products_attributes_and_tags_together():
+    conn = FakeConnection()
+    ids = catalog_io._insert_chunk(FakeProductManager(conn), [_row(), _row(name='Tra dao')], 1)
+    assert ids == [100, 101]
+    assert conn.committed == ['products', 'attributes', 'tags']
+
+
+def test_validate_row_rejects_long_attribute_names():
+    with pytest.raises(ValueError, match="attribute names"):
+        _row(attributes={'x' * 51: ['value']})
+    assert _row(attributes={'x' * 50: ['value']})['extra_attributes'] == {'x' * 50: ['value']}
+
+
+def test_chunk_fills_legacy_ai_keys_column_while_it_exists():
+    conn = FakeConnection()
+    catalog_io._insert_chunk(FakeProductManager(conn, legacy_ai_keys=True), [_row(), _row(ai_keys='')], 1)
+    sql, params = conn.product_insert
+    assert "image_url, ai_keys)" in sql
+    assert params[6] == '["dau", "kem"]'
+    assert params[13] is None
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from order_events import OrderChangeFeed, OrderEventBus
+
+VERSION_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class FakeOrderManager:
+    """Serves queued get_orders_changed_since results, as another process's writes would appear."""
+
+    def __init__(self):
+        self.results = []
+        self.calls = []
+
+    def get_change_version(self):
+        return "2026-01-01 10:00:00.000000"
+
+    def get_orders_changed_since(self, since=None, statuses=None):
+        self.calls.append(since)
+        return self.results.pop(0)
+
+    def _parse_change_version(self, version):
+        return datetime.strptime(version, VERSION_FORMAT)
+
+
+def _order(order_id, status, created, updated, table_number=3):
+    return {
+        'id': order_id,
+        'status': status,
+        'table_number': table_number,
+        'created_at': datetime(2026, 1, 1, 10, 0, created),
+        'updated_at': datetime(2026, 1, 1, 10, 0, updated),
+    }
+
+
+def _changes(version_second, orders=(), deleted=(), reset=False):
+    return {
+        'orders': list(orders),
+        'deleted': list(deleted),
+        'version': f"2026-01-01 10:00:{version_second:02d}.000000",
+        'reset': reset,
+    }
+
+
+def _events(bus, after):
+    events, _ = bus.wait_for_events(after, 0)
+    return [(event['type'], event['order_id'], event['data'].get('status')) for event in events]
+
+
+def test_feed_publishes_changes_from_other_processes_once():
+    bus = OrderEventBus()
+    manager = FakeOrderManager()
+    feed = OrderChangeFeed(bus, manager)
+
+    assert feed.poll() == 0  # baseline: only the current version
+    manager.results = [
+        _changes(1, [_order(7, 'pending', created=2, updated=2)]),
+        # Overlap window repeats the same row; then the kitchen app changes its status
+        _changes(2, [_order(7, 'pending', created=2, updated=2)]),
+        _changes(3, [_order(7, 'confirmed', created=2, updated=4)], deleted=[5]),
+        _changes(4, deleted=[5]),
+    ]
+    for _ in range(4):
+        feed.poll()
+
+    assert manager.calls[0] == "2026-01-01 10:00:00.000000"
+    assert _events(bus, 0) == [
+        ('order.created', 7, 'pending'),
+        ('order.status_changed', 7, 'confirmed'),
+        ('order.deleted', 5, None),
+    ]
+
+
+def test_feed_edit_without_status_change_is_an_update():
+    bus = OrderEventBus()
+    manager = FakeOrderManager()
+    feed = OrderChangeFeed(bus, manager)
+    feed.poll()
+    manager.results = [
+        _changes(9, [_order(2, 'confirmed', created=0, updated=5)]),
+        _changes(9, [_order(2, 'confirmed', created=0, updated=8)]),
+    ]
+    feed.poll()
+    feed.poll()
+    assert _events(bus, 0) == [('order.updated', 2, 'confirmed'), ('order.updated', 2, 'confirmed')]
+
+
+def test_feed_reset_asks_subscribers_to_resynchronize():
+    bus = OrderEventBus()
+    manager = FakeOrderManager()
+    feed = OrderChangeFeed(bus, manager)
+    feed.poll()
+    manager.results = [_changes(30, [_order(1, 'pending', created=0, updated=0)], reset=True)]
+    assert feed.poll() == 1
+    assert _events(bus, 0) == [('reset', None, None)]
@@ -0,0 +1,135 @@
+import json
+
+import migrations
+from product_manager import ProductManager
+
+
+class FakeStore:
+    """Just enough of products/product_attributes/product_tags for the tag code paths."""
+
+    def __init__(self):
+        self.has_ai_keys_column = True
+        self.ai_keys = {}
+        self.attributes = []
+        self.tags = set()
+
+    def add_legacy_product(self, product_id, tags):
+        """A product as migration 6 leaves it: both legacy copies plus product_tags."""
+        self.ai_keys[product_id] = json.dumps(sorted(tags))
+        self.attributes.extend((product_id, 'ai_keys', tag) for tag in tags)
+        self.tags.update((product_id, tag) for tag in tags)
+
+    def tags_of(self, product_id):
+        return sorted(tag for pid, tag in self.tags if pid == product_id)
+
+
+class FakeCursor:
+    def __init__(self, store):
+        self.store = store
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        store = self.store
+        self.rows = []
+        if sql == "SHOW COLUMNS FROM products LIKE 'ai_keys'":
+            self.rows = [('ai_keys',)] if store.has_ai_keys_column else []
+        elif sql == "UPDATE products SET ai_keys = %s WHERE id = %s":
+            store.ai_keys[params[1]] = params[0]
+        elif sql.startswith("UPDATE products SET"):
+            pass
+        elif sql == "DELETE FROM product_attributes WHERE product_id = %s":
+            store.attributes = [row for row in store.attributes if row[0] != params[0]]
+        elif sql == "DELETE FROM product_attributes WHERE attribute_type = %s":
+            store.attributes = [row for row in store.attributes if row[1] != params[0]]
+        elif sql == "DELETE FROM product_tags WHERE product_id = %s":
+            store.tags = {pair for pair in store.tags if pair[0] != params[0]}
+        elif sql.startswith("SELECT product_id, attribute_value FROM product_attributes"):
+            self.rows = [(pid, value) for pid, attr_type, value in store.attributes if attr_type == params[0]]
+        elif sql == "SELECT id, ai_keys FROM products WHERE ai_keys IS NOT NULL":
+            self.rows = [(pid, raw) for pid, raw in sorted(store.ai_keys.items()) if raw is not None]
+        elif sql == "SELECT product_id, tag FROM product_tags":
+            self.rows = sorted(store.tags)
+        elif sql.startswith("INSERT IGNORE INTO product_tags"):
+            store.tags.update(zip(params[::2], params[1::2]))
+        elif sql.startswith("DELETE FROM product_tags WHERE (product_id, tag) IN"):
+            store.tags.difference_update(zip(params[::2], params[1::2]))
+        elif sql == "ALTER TABLE products DROP COLUMN ai_keys":
+            store.has_ai_keys_column = False
+            store.ai_keys = {}
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def executemany(self, sql, rows):
+        if sql.startswith("INSERT INTO product_tags"):
+            self.store.tags.update(rows)
+        elif sql.lstrip().startswith("INSERT INTO product_attributes"):
+            self.store.attributes.extend(rows)
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, store):
+        self.cursor = FakeCursor(store)
+        self.conn = FakeConnection()
+
+    def reconnect_if_needed(self):
+        pass
+
+
+def _product_manager(store):
+    manager = ProductManager(db=FakeDatabase(store))
+    manager.get_product = lambda product_id: {'name': 'Banh kem', 'description': None}
+    return manager
+
+
+def test_tags_removed_by_update_stay_removed_after_migration_7():
+    store = FakeStore()
+    store.add_legacy_product(1, ['dau', 'socola'])
+
+    assert _product_manager(store).update_product(1, attributes={'ai_keys': ['dau']})
+    assert store.tags_of(1) == ['dau']
+    assert json.loads(store.ai_keys[1]) == ['dau']
+
+    migrations.drop_legacy_ai_keys(FakeCursor(store), FakeConnection())
+    assert store.tags_of(1) == ['dau']
+    assert not store.has_ai_keys_column
+
+
+def test_migration_7_picks_up_tags_written_by_older_processes():
+    store = FakeStore()
+    store.add_legacy_product(1, ['dau'])
+    store.add_legacy_product(2, ['tra'])
+    # An older process retags product 1 and clears product 2 after migration 6
+    store.ai_keys[1] = json.dumps(['kem'])
+    store.attributes = [(1, 'ai_keys', 'kem')]
+    store.ai_keys[2] = None
+
+    migrations.drop_legacy_ai_keys(FakeCursor(store), FakeConnection())
+    assert store.tags_of(1) == ['kem']
+    assert store.tags_of(2) == []
+    assert store.attributes == []
+
+
+def test_tag_writes_skip_the_legacy_column_once_dropped():
+    store = FakeStore()
+    store.has_ai_keys_column = False
+    assert _product_manager(store).update_product(3, attributes={'ai_keys': 'tra; dao'})
+    assert store.tags_of(3) == ['dao', 'tra']
+    assert store.ai_keys == {}
@@ -0,0 +1,62 @@
+"""Text normalization helpers shared by the managers and migrations."""
+import json
+import re
+import unicodedata
+
+TABLE_NAME_TOKENS = ("bàn", "ban", "table", "tbl", "#")
+_WORD_RE = re.compile(r"[0-9a-z]+")
+
+
+def table_lookup_key(value):
+    """Normalize a table number or display name ("Bàn 05", "table #5") for lookups."""
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    for token in TABLE_NAME_TOKENS:
+        text = text.replace(token, "")
+    text = "".join(ch for ch in text if ch.isalnum())
+    return text
+
+
+def fold_diacritics(text):
+    """Lowercase and strip accents so "Bánh kem" and "banh kem" compare equal."""
+    if not text:
+        return ""
+    text = str(text).lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def search_tokens(text):
+    """Split text into folded alphanumeric search tokens."""
+    return _WORD_RE.findall(fold_diacritics(text))
+
+
+def parse_ai_keys(raw):
+    """Return the list of ai_keys stored as a list, JSON array or comma/semicolon text."""
+    if not raw:
+        return []
+    if isinstance(raw, (list, tuple, set)):
+        items = raw
+    elif isinstance(raw, str):
+        candidate = raw.strip()
+        if not candidate:
+            return []
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            items = candidate.replace(';', ',').split(',')
+        else:
+            if isinstance(parsed, str):
+                parsed = [parsed]
+            items = parsed if isinstance(parsed, (list, tuple, set)) else []
+    else:
+        items = [raw]
+    keys = []
+    for item in items:
+        item_str = str(item).strip()
+        if item_str:
+            keys.append(item_str)
+    return keys
@@ -0,0 +1,57 @@
+"""Run blocking work off the Tk main thread and deliver results back on it."""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TkBackgroundRunner:
+    """Thread pool whose completion callbacks run on the Tk thread.
+
+    Workers never touch widgets: finished results are queued and drained by
+    a short ``after`` loop that only runs while jobs are outstanding.
+    """
+
+    def __init__(self, root, max_workers=1, poll_ms=30, name="tk-worker"):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._results = queue.Queue()
+        self._outstanding = 0
+        self._poll_job = None
+
+    def submit(self, func, on_done, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` on a worker; call ``on_done(result, error)`` on the Tk thread."""
+        def run():
+            try:
+                result, error = func(*args, **kwargs), None
+            except Exception as exc:  # pylint: disable=broad-except
+                result, error = None, exc
+            self._results.put((on_done, result, error))
+
+        self._outstanding += 1
+        self._executor.submit(run)
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        self._poll_job = None
+        while True:
+            try:
+                on_done, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._outstanding -= 1
+            try:
+                on_done(result, error)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"Error in background callback: {exc}")
+        if self._outstanding > 0:
+            self._poll_job = self.root.after(self.poll_ms, self._drain)
+
+    def shutdown(self):
+        if self._poll_job is not None:
+            try:
+                self.root.after_cancel(self._poll_job)
+            except Exception:
+                pass
+            self._poll_job = None
+        self._executor.shutdown(wait=False)
@@ -1,5 +1,5 @@
 import { useCallback, useEffect, useMemo, useState } from 'react';
-import { getOrder } from '@mobile/services/orderApi';
+import { getOrder, subscribeOrderEvents } from '@mobile/services/orderApi';
 import {
   getGuestOrders,
   saveGuestOrders,
@@ -142,10 +142,23 @@ const OrdersScreen = () => {
 
   useEffect(() => {
     void refreshOrders();
+    const unsubscribe = subscribeOrderEvents(event => {
+      const tracked = getGuestOrders().some(record => record.id === event.order_id);
+      if (event.type === 'reset' || tracked) {
+        void refreshOrders();
+      }
+    });
+    // Every worker publishes changes made by any process (other workers, the
+    // desktop apps), so with a live stream polling is only a slow safety net
     const interval = window.setInterval(() => {
       void refreshOrders();
-    }, 15000);
-    return () => window.clearInterval(interval);
+    }, unsubscribe ? 120000 : 15000);
+    return () => {
+      window.clearInterval(interval);
+      if (unsubscribe) {
+        unsubscribe();
+      }
+    };
   }, [refreshOrders]);
 
   const filteredOrders = useMemo(() => {
@@ -74,3 +74,33 @@ export const deleteOrder = async (orderId: number) => {
   });
   return handleResponse<{ message: string }>(response);
 };
+
+export interface OrderEvent {
+  type: string;
+  order_id: number;
+  status?: string;
+}
+
+const ORDER_EVENT_TYPES = ['order.created', 'order.updated', 'order.status_changed', 'order.deleted', 'reset'];
+
+/**
+ * Subscribe to the server's order event stream. Returns an unsubscribe
+ * function, or null when the browser has no EventSource support.
+ */
+export const subscribeOrderEvents = (onEvent: (event: OrderEvent) => void) => {
+  if (typeof EventSource === 'undefined') {
+    return null;
+  }
+  const source = new EventSource(`${API_BASE_URL}/events/orders`);
+  const listener = (message: MessageEvent) => {
+    let data: Partial<OrderEvent> = {};
+    try {
+      data = JSON.parse(message.data);
+    } catch (err) {
+      data = {};
+    }
+    onEvent({ ...data, type: message.type, order_id: Number(data.order_id) });
+  };
+  ORDER_EVENT_TYPES.forEach(type => source.addEventListener(type, listener as EventListener));
+  return () => source.close();
+};